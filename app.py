@@ -4,10 +4,16 @@ from flask import request
 from config import Config
 import jwt
 from extension import db, bcrypt, limiter
+from util.auth_utils import token_payload, RevokedTokenError, principal_cache
+from util.passwords import PasswordPoolBusy, busy_response, password_pool
+from util.logging_config import configure_logging
+from util.singleflight import aggregate_cache
+from util.tokens import revoked_sessions
 from flask_limiter.util import get_remote_address
 
 app = Flask(__name__)
 app.config.from_object(Config)
+configure_logging(app)
 CORS(app, resources={
     r"/*": {
         "origins": ["http://localhost:5173", "http://127.0.0.1:5173"],
@@ -18,7 +24,11 @@ CORS(app, resources={
 })
 db.init_app(app)
 bcrypt.init_app(app)
+password_pool.init_app(app)
 limiter.init_app(app)
+aggregate_cache.init_app(app)
+principal_cache.init_app(app)
+revoked_sessions.init_app(app)
 # Rate limiting configuration
 def rate_limit_key():
     if request.method == 'OPTIONS':
@@ -39,6 +49,7 @@ from routes.adminRoutes import admin_bp
 from routes.transactionsRoutes import transactions_bp
 from routes.commandeRoutes import commande_bp
 from routes.boostRoutes import boost_bp
+from routes.payoutRoutes import payout_bp
 
 # Register blueprints
 app.register_blueprint(user_bp)
@@ -54,6 +65,12 @@ app.register_blueprint(admin_bp)
 app.register_blueprint(transactions_bp)
 app.register_blueprint(commande_bp)
 app.register_blueprint(boost_bp)
+app.register_blueprint(payout_bp)
+
+
+@app.errorhandler(PasswordPoolBusy)
+def password_pool_busy(e):
+    return busy_response()
 
 
 @app.before_request
@@ -62,6 +79,8 @@ def check_token_middleware():
     excluded_endpoints = [
         'auth.login_user',
         'auth.login_admin',
+        'auth.refresh_token',
+        'auth.logout',
         'user.create_user',
         'static'
     ]
@@ -78,19 +97,19 @@ def check_token_middleware():
 
     try:
         # Expected format: "Bearer <token>"
-        if 'Bearer ' not in auth_header:
+        if not auth_header.startswith('Bearer '):
             return jsonify({'error': 'Invalid token format'}), 401
 
-        token = auth_header.split(" ")[1]
-
-        # Verify token
-        payload = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+        # Decoded once here, admin_required/user_required reuse it from g
+        payload = token_payload()
 
         # Add user info to request context
         request.current_user_id = payload.get('user_id')
 
     except jwt.ExpiredSignatureError:
         return jsonify({'error': 'Token has expired'}), 401
+    except RevokedTokenError:
+        return jsonify({'error': 'Token has been revoked'}), 401
     except jwt.InvalidTokenError:
         return jsonify({'error': 'Invalid token'}), 401
     except Exception as e:
@@ -0,0 +1,63 @@
+"""Insert throughput into a table clustered on a 12-char id: old random ids vs. utils.generate_ids.
+
+    python benchmarks/id_inserts.py [rows] [batch]
+
+Uses a WITHOUT ROWID SQLite table, clustered on its primary key like InnoDB,
+with an 8 MB page cache so the index outgrows memory as it does in production.
+"""
+import os
+import re
+import secrets
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import generate_ids  # noqa: E402
+
+
+def random_id():
+    """The generator these ids replaced"""
+    while True:
+        candidate = secrets.token_urlsafe(16)[:12]
+        if re.match(r'^[a-zA-Z0-9]{12}$', candidate):
+            return candidate
+
+
+def bench(name, make_ids, rows, batch):
+    path = os.path.join(tempfile.mkdtemp(), f'{name}.db')
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA cache_size=-8000')
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute(
+        'CREATE TABLE transactions (id VARCHAR(12) PRIMARY KEY, user_id VARCHAR(12), date_transaction DATETIME, '
+        'action VARCHAR(20), montant NUMERIC(10,2), status VARCHAR(9)) WITHOUT ROWID'
+    )
+    rates = []
+    started = time.perf_counter()
+    for _ in range(0, rows, batch):
+        ids = make_ids(batch)
+        batch_started = time.perf_counter()
+        connection.executemany('INSERT INTO transactions VALUES (?, ?, ?, ?, ?, ?)',
+                               [(id_, 'user', '2026-01-01', 'recharge', 10, 'PENDING') for id_ in ids])
+        connection.commit()
+        rates.append(batch / (time.perf_counter() - batch_started))
+    elapsed = time.perf_counter() - started
+    size = os.path.getsize(path) // 2 ** 20
+    connection.close()
+
+    fifth = max(1, len(rates) // 5)
+    print(f'{name:8} first 20%: {sum(rates[:fifth]) / fifth:9.0f} rows/s   '
+          f'last 20%: {sum(rates[-fifth:]) / fifth:9.0f} rows/s   total {elapsed:6.1f} s   {size} MB')
+
+
+def main(rows=1_500_000, batch=5000):
+    print(f'{rows} rows in batches of {batch}')
+    bench('random', lambda n: [random_id() for _ in range(n)], rows, batch)
+    bench('ordered', generate_ids, rows, batch)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,51 @@
+"""Login throughput: bcrypt inline vs. util.passwords.PasswordPool at several pool sizes.
+
+    python benchmarks/password_pool.py [rounds] [logins] [threads]
+
+Each login is one verify() of a hash made with `rounds` (10 by default),
+issued from `threads` concurrent request threads.
+"""
+import os
+import sys
+import threading
+import time
+
+import bcrypt
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from util.passwords import PasswordPool  # noqa: E402
+
+
+def run_threads(threads, logins, verify):
+    def worker():
+        for _ in range(logins // threads):
+            verify()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return logins / (time.perf_counter() - started)
+
+
+def main(rounds=10, logins=64, threads=16):
+    hashed = bcrypt.hashpw(b'password', bcrypt.gensalt(rounds)).decode('utf-8')
+
+    inline = run_threads(threads, logins, lambda: bcrypt.checkpw(b'password', hashed.encode('utf-8')))
+    print(f'{os.cpu_count()} CPUs, cost {rounds}, {logins} logins from {threads} threads')
+    print(f'inline          {inline:8.1f} logins/s')
+
+    for size in sorted({1, 2, 4, 8, os.cpu_count() or 1}):
+        # Same work factor as the hash, so verify() never rehashes
+        pool = PasswordPool(size, queue_limit=logins, timeout=60, rounds=rounds)
+        pool.verify('password', hashed)  # start the worker processes before timing
+        rate = run_threads(threads, logins, lambda: pool.verify('password', hashed))
+        pool._executor.shutdown()
+        print(f'pool of {size:<2}      {rate:8.1f} logins/s')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
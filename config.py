@@ -5,3 +5,32 @@ class Config:
     SQLALCHEMY_DATABASE_URI = 'mysql+pymysql://adr:Niavo jr171102!@localhost:3306/tiktokshop'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
+    # Admin aggregates: seconds served fresh, then seconds served stale while refreshing
+    AGGREGATE_CACHE_TTL = int(os.environ.get('AGGREGATE_CACHE_TTL', 15))
+    AGGREGATE_CACHE_STALE_TTL = int(os.environ.get('AGGREGATE_CACHE_STALE_TTL', 120))
+    # Admin review queue: how long a claimed transaction stays reserved to one admin
+    REVIEW_LEASE_SECONDS = int(os.environ.get('REVIEW_LEASE_SECONDS', 300))
+    # Authenticated users/admins cached per worker: max entries, seconds before a reload
+    AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', 10000))
+    AUTH_CACHE_TTL = int(os.environ.get('AUTH_CACHE_TTL', 60))
+    # Password hashing: bcrypt work factor (also read by Flask-Bcrypt), worker processes,
+    # calls allowed to run or wait before answering 503, seconds to wait for a result
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    BCRYPT_POOL_SIZE = int(os.environ.get('BCRYPT_POOL_SIZE', os.cpu_count() or 2))
+    BCRYPT_QUEUE_LIMIT = int(os.environ.get('BCRYPT_QUEUE_LIMIT', 8 * (os.cpu_count() or 2)))
+    BCRYPT_TIMEOUT = int(os.environ.get('BCRYPT_TIMEOUT', 10))
+    # Access tokens (JWT) are short-lived; refresh tokens rotate on use and can be revoked
+    ACCESS_TOKEN_TTL = int(os.environ.get('ACCESS_TOKEN_TTL', 900))
+    REFRESH_TOKEN_TTL = int(os.environ.get('REFRESH_TOKEN_TTL', 30 * 24 * 3600))
+    # Seconds between reloads of the revoked sessions each worker keeps in memory
+    REVOCATION_REFRESH_SECONDS = int(os.environ.get('REVOCATION_REFRESH_SECONDS', 30))
+    # Logging: JSON lines written by a background thread, rotated by size and by time
+    LOG_DIR = os.environ.get('LOG_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs'))
+    LOG_FILE = os.environ.get('LOG_FILE', 'logFile.log')
+    LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024))
+    LOG_ROTATE_WHEN = os.environ.get('LOG_ROTATE_WHEN', 'midnight')
+    LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 14))
+    # Records waiting for the writer before new ones are dropped; keep 1 DEBUG line in N per call site
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+    LOG_DEBUG_SAMPLE_EVERY = int(os.environ.get('LOG_DEBUG_SAMPLE_EVERY', 10))
@@ -1,87 +1,127 @@
+from datetime import datetime, timedelta
 from flask import jsonify, request
-from models import Admin, User, Boost, Transaction, TransactionStatus, Parrainage
+from models import Admin, User, Boost, Transaction, TransactionStatus, Parrainage, FinanceDailyRollup
 from extension import db
 from util.auth_utils import admin_required
+from util.passwords import password_pool
+from util.tokens import revoke_subject, current_family
 from models import BoostStatut
 from sqlalchemy import not_, exists
+from sqlalchemy.orm import joinedload
+from util.pagination import keyset_paginate, PaginationError
+from util.singleflight import aggregate_cache
+from util.export import stream_export, EXPORT_FORMATS
+from controllers.balanceController import BalanceController
+
+def requested_day_range():
+    """[start, end) of ?date=YYYY-MM-DD, today when absent; raises ValueError on a bad date"""
+    if request.args.get('date'):
+        day_start = datetime.strptime(request.args['date'], '%Y-%m-%d')
+    else:
+        day_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return day_start, day_start + timedelta(days=1)
+
 
 class AdminController:
 
     @staticmethod
     @admin_required
     def get_dashboard_stats():
-        """Get dashboard statistics"""
-        from sqlalchemy import func
+        """Get dashboard statistics (shared single-flight cache)"""
         try:
-            # Total users
-            total_users = User.query.count()
-
-            boosts_completed = Boost.query.filter(Boost.statut == BoostStatut.TERMINEE).count()
-
-            # Recharge completed amount
-            recharge_completed = db.session.query(func.sum(Transaction.montant)).filter(
-                Transaction.action == 'recharge',
-                Transaction.status == TransactionStatus.COMPLETED
-            ).scalar() or 0
+            return jsonify(aggregate_cache.get('dashboard_stats', AdminController.compute_dashboard_stats)), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
 
-            # Retrait completed amount
-            retrait_completed = db.session.query(func.sum(Transaction.montant)).filter(
-                Transaction.action == 'retrait',
-                Transaction.status == TransactionStatus.COMPLETED
-            ).scalar() or 0
+    @staticmethod
+    def compute_dashboard_stats():
+        from sqlalchemy import func
 
-            return jsonify({
-                'total_users': total_users,
-                'boosts_completed': boosts_completed,
-                'recharge_completed': float(recharge_completed),
-                'retrait_completed': float(retrait_completed)
-            }), 200
+        # Total users
+        total_users = User.query.count()
+
+        boosts_completed = Boost.query.filter(Boost.statut == BoostStatut.TERMINEE).count()
+
+        # Completed recharge/retrait amounts, summed over the daily rollup (one row per day)
+        completed = dict(db.session.query(
+            FinanceDailyRollup.action,
+            func.sum(FinanceDailyRollup.montant)
+        ).filter(
+            FinanceDailyRollup.action.in_(['recharge', 'retrait']),
+            FinanceDailyRollup.status == TransactionStatus.COMPLETED
+        ).group_by(FinanceDailyRollup.action).all())
+        recharge_completed = completed.get('recharge') or 0
+        retrait_completed = completed.get('retrait') or 0
+
+        return {
+            'total_users': total_users,
+            'boosts_completed': boosts_completed,
+            'recharge_completed': float(recharge_completed),
+            'retrait_completed': float(retrait_completed)
+        }
 
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
+    @staticmethod
+    @admin_required
+    def get_cache_stats():
+        """Hit/miss/coalesced counters of the aggregate cache in this worker"""
+        return jsonify(aggregate_cache.stats()), 200
 
     @staticmethod
     @admin_required
     def get_dashboard_finance():
-        """Get finance stats for today (recharge and retrait)"""
+        """Get finance stats for one day (?date=YYYY-MM-DD, default today)"""
         try:
-            from datetime import datetime, time
             from sqlalchemy import func
 
-            # Get start of today
-            today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-
-            # Query transactions for today, filter by recharge/retrait
-            transactions = Transaction.query.filter(
-                Transaction.date_transaction >= today_start,
+            try:
+                day_start, day_end = requested_day_range()
+            except ValueError:
+                return jsonify({'error': 'date must use YYYY-MM-DD'}), 400
+
+            # Rows and user name in one column-only statement
+            rows = db.session.query(
+                Transaction.id,
+                Transaction.user_id,
+                User.nom.label('user_nom'),
+                Transaction.action,
+                Transaction.montant,
+                Transaction.date_transaction,
+                Transaction.status
+            ).outerjoin(
+                User, User.id == Transaction.user_id
+            ).filter(
+                Transaction.date_transaction >= day_start,
+                Transaction.date_transaction < day_end,
                 Transaction.action.in_(['recharge', 'retrait'])
-            ).all()
+            ).order_by(Transaction.date_transaction.desc()).all()
 
-            tx_data = []
-            total_recharge = 0
-            total_retrait = 0
-
-            for tx in transactions:
-                if tx.status == TransactionStatus.COMPLETED:
-                    if tx.action == 'recharge':
-                        total_recharge += float(tx.montant)
-                    elif tx.action == 'retrait':
-                        total_retrait += float(tx.montant)
+            # Completed totals come from the day's rollup buckets, not from the rows
+            totals = dict(db.session.query(
+                FinanceDailyRollup.action,
+                func.sum(FinanceDailyRollup.montant)
+            ).filter(
+                FinanceDailyRollup.day == day_start.date(),
+                FinanceDailyRollup.action.in_(['recharge', 'retrait']),
+                FinanceDailyRollup.status == TransactionStatus.COMPLETED
+            ).group_by(FinanceDailyRollup.action).all())
 
+            tx_data = []
+            for row in rows:
                 tx_data.append({
-                    "id": tx.id,
-                    "user": tx.user.nom if tx.user else "Unknown",
-                    "idUser": tx.user.id if tx.user else "Unknown",
-                    "type": tx.action,
-                    "amount": float(tx.montant),
-                    "date": tx.date_transaction.strftime('%Y-%m-%d %H:%M:%S'),
-                    "status": tx.status.value if hasattr(tx.status, 'value') else str(tx.status)
+                    "id": row.id,
+                    "user": row.user_nom if row.user_nom else "Unknown",
+                    "idUser": row.user_id if row.user_nom else "Unknown",
+                    "type": row.action,
+                    "amount": float(row.montant),
+                    "date": row.date_transaction.strftime('%Y-%m-%d %H:%M:%S'),
+                    "status": row.status.value
                 })
 
             return jsonify({
+                "date": day_start.date().isoformat(),
                 "total_transaction": len(tx_data),
-                "total_recharge": total_recharge,
-                "total_retrait": total_retrait,
+                "total_recharge": float(totals.get('recharge') or 0),
+                "total_retrait": float(totals.get('retrait') or 0),
                 "transactions": tx_data
             }), 200
 
@@ -91,33 +131,44 @@ class AdminController:
     @staticmethod
     @admin_required
     def get_dashboard_boosts():
-        """Get completed boosts for today"""
+        """Get completed boosts for one day (?date=YYYY-MM-DD, default today)"""
         try:
-            from datetime import datetime
             from models import Commande
 
-            # Get start of today
-            today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-
-            # Query boosts that are completed and joined with Commande date today
-            # The date to check is in Commande table
-            boosts = Boost.query.filter(
+            try:
+                day_start, day_end = requested_day_range()
+            except ValueError:
+                return jsonify({'error': 'date must use YYYY-MM-DD'}), 400
+
+            rows = db.session.query(
+                Boost.idBoost,
+                Boost.date,
+                User.nom.label('user_nom'),
+                Commande.code.label('commande_code'),
+                Commande.commission_total
+            ).outerjoin(
+                User, User.id == Boost.idUtilisateur
+            ).outerjoin(
+                Commande, Commande.idCommande == Boost.idCommande
+            ).filter(
                 Boost.statut.in_([BoostStatut.TERMINEE, BoostStatut.EN_ATTENTE]),
-                Boost.date >= today_start
-            ).all()
+                Boost.date >= day_start,
+                Boost.date < day_end
+            ).order_by(Boost.date.desc()).all()
 
             boost_data = []
 
-            for boost in boosts:
+            for row in rows:
                 boost_data.append({
-                    "id": boost.idBoost,
-                    "user": boost.user.nom if boost.user else "Unknown",
-                    "commande_code": boost.commande.code if boost.commande else "Unknown",
-                    "commission": float(boost.commande.commission_total) if (boost.commande and boost.commande.commission_total) else 0.0,
-                    "date": boost.date.strftime('%Y-%m-%d %H:%M:%S')
+                    "id": row.idBoost,
+                    "user": row.user_nom if row.user_nom else "Unknown",
+                    "commande_code": row.commande_code if row.commande_code else "Unknown",
+                    "commission": float(row.commission_total) if row.commission_total else 0.0,
+                    "date": row.date.strftime('%Y-%m-%d %H:%M:%S')
                 })
 
             return jsonify({
+                "date": day_start.date().isoformat(),
                 "total_boosts": len(boost_data),
                 "boosts": boost_data
             }), 200
@@ -134,8 +185,8 @@ class AdminController:
         if not data:
             return jsonify({'error': 'No data provided'}), 400
 
-        # Get admin by ID
-        admin = Admin.query.first()
+        # The calling admin
+        admin = db.session.get(Admin, request.admin.id)
         if not admin:
             return jsonify({'error': 'Admin not found'}), 404
 
@@ -154,7 +205,9 @@ class AdminController:
         # Update password if provided
         new_password = data.get('new_password')
         if new_password:
-            admin.mot_de_passe = new_password
+            admin.mot_de_passe = password_pool.hash(new_password)
+            # Sign out the admin's other sessions, as change_password does for users
+            revoke_subject('admin', admin.id, keep_family=current_family('admin', admin.id))
 
         try:
             db.session.commit()
@@ -167,27 +220,44 @@ class AdminController:
             }), 200
         except Exception as e:
             db.session.rollback()
+            return jsonify({'error': str(e)}), 500
 
     @staticmethod
     @admin_required
     def transaction_normal():
         try:
-            # Sous-requête pour obtenir tous les transaction_id de la table boost
-            boost_transaction_ids = db.session.query(Boost.transaction_id).filter(Boost.transaction_id.isnot(None))
-
-            transactions = Transaction.query.filter(
+            # Anti-jointure sur ix_boosts_transaction: exclut les retraits "system" créés par les boosts
+            query = db.session.query(
+                Transaction.id,
+                Transaction.user_id,
+                User.nom.label('user_nom'),
+                User.email.label('user_email'),
+                Transaction.date_transaction,
+                Transaction.action,
+                Transaction.montant,
+                Transaction.status,
+                Transaction.image_filename,
+                Transaction.transaction_hash,
+                Transaction.sender_address,
+                Transaction.recipient_address
+            ).outerjoin(
+                User, User.id == Transaction.user_id
+            ).outerjoin(
+                Boost, Boost.transaction_id == Transaction.id
+            ).filter(
                 Transaction.action.in_(['recharge', 'retrait']),
-                ~Transaction.id.in_(boost_transaction_ids)
-            ).order_by(Transaction.date_transaction.desc()).all()
+                Boost.idBoost.is_(None)
+            )
+
+            transactions, next_cursor = keyset_paginate(query, Transaction.date_transaction, Transaction.id)
 
             tx_data = []
             for tx in transactions:
-                user = tx.user
                 tx_data.append({
                     "idtransaction": tx.id,
                     "userId": tx.user_id,
-                    "userName": user.nom if user else "Unknown",
-                    "userEmail": user.email if user else "Unknown",
+                    "userName": tx.user_nom if tx.user_nom else "Unknown",
+                    "userEmail": tx.user_email if tx.user_email else "Unknown",
                     "date": tx.date_transaction.strftime('%Y-%m-%d %H:%M:%S'),
                     "type": tx.action,
                     "valeur": float(tx.montant),
@@ -199,8 +269,11 @@ class AdminController:
                 })
 
             return jsonify({
-                "transactions": tx_data
+                "transactions": tx_data,
+                "next_cursor": next_cursor
             }), 200
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -208,7 +281,10 @@ class AdminController:
     @admin_required
     def transactionParrainage():
         try:
-            parrainages = Parrainage.query.order_by(Parrainage.date.desc()).all()
+            parrainages, next_cursor = keyset_paginate(
+                Parrainage.query.options(joinedload(Parrainage.old_user)),
+                Parrainage.date, Parrainage.idParainnage
+            )
 
             tx_data = []
             for p in parrainages:
@@ -225,7 +301,79 @@ class AdminController:
                 })
 
             return jsonify({
-                "transactions": tx_data
+                "transactions": tx_data,
+                "next_cursor": next_cursor
             }), 200
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
-            return jsonify({'error': str(e)}), 500
\ No newline at end of file
+            return jsonify({'error': str(e)}), 500
+
+    @staticmethod
+    @admin_required
+    def export_transactions():
+        """Stream transactions as NDJSON or CSV (?format, ?start, ?end, ?action, ?status)"""
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': 'Invalid format. Must be ndjson or csv'}), 400
+
+        query = db.select(
+            Transaction.id,
+            Transaction.user_id,
+            User.nom.label('user_nom'),
+            User.email.label('user_email'),
+            Transaction.date_transaction,
+            Transaction.action,
+            Transaction.montant,
+            Transaction.status,
+            Transaction.commentaire,
+            Transaction.transaction_hash,
+            Transaction.sender_address,
+            Transaction.recipient_address
+        ).outerjoin(User, User.id == Transaction.user_id).order_by(Transaction.date_transaction, Transaction.id)
+
+        try:
+            if request.args.get('start'):
+                start = datetime.strptime(request.args['start'], '%Y-%m-%d')
+                query = query.where(Transaction.date_transaction >= start)
+            if request.args.get('end'):
+                end = datetime.strptime(request.args['end'], '%Y-%m-%d') + timedelta(days=1)
+                query = query.where(Transaction.date_transaction < end)
+        except ValueError:
+            return jsonify({'error': 'start/end must use YYYY-MM-DD'}), 400
+
+        action = request.args.get('action')
+        if action:
+            if action not in ['recharge', 'retrait', 'gain']:
+                return jsonify({'error': 'Invalid action. Must be recharge, retrait or gain'}), 400
+            query = query.where(Transaction.action == action)
+
+        status = request.args.get('status')
+        if status:
+            valid_statuses = [s.name for s in TransactionStatus]
+            if status not in valid_statuses:
+                return jsonify({'error': f'Invalid status. Must be one of: {valid_statuses}'}), 400
+            query = query.where(Transaction.status == TransactionStatus[status])
+
+        columns = ['id', 'user_id', 'user_nom', 'user_email', 'date', 'action', 'montant', 'status',
+                   'commentaire', 'transaction_hash', 'sender_address', 'recipient_address']
+
+        def serialize(row):
+            return [
+                row.id, row.user_id, row.user_nom, row.user_email,
+                row.date_transaction.strftime('%Y-%m-%d %H:%M:%S') if row.date_transaction else None,
+                row.action, float(row.montant), row.status.value, row.commentaire,
+                row.transaction_hash, row.sender_address, row.recipient_address
+            ]
+
+        filename = f"transactions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+        return stream_export(query, columns, serialize, export_format, filename)
+
+    @staticmethod
+    @admin_required
+    def settle_referrals():
+        """Run the referral settlement job now instead of waiting for the next deferred run"""
+        try:
+            return jsonify(BalanceController.settle_referrals()), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
@@ -1,57 +1,9 @@
-import os
 import logging
-import jwt
-import sys
-from datetime import datetime, timedelta, timezone
-from flask import jsonify, request, current_app
+from flask import jsonify, request
 from extension import db, limiter
 from models import User, Admin
-
-
-# Redirect print statements to log file
-class StreamToLogger(object):
-    """Fake file-like stream object that redirects writes to a logger instance."""
-    def __init__(self, logger, log_level=logging.INFO):
-        self.logger = logger
-        self.log_level = log_level
-        self.linebuf = ''
-
-    def write(self, buf):
-        for line in buf.rstrip().splitlines():
-            self.logger.log(self.log_level, line.rstrip())
-
-    def flush(self):
-        pass
-
-# Configure logging
-log_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
-os.makedirs(log_dir, exist_ok=True)
-
-log_file = os.path.join(log_dir, 'logFile.log')
-
-logging.basicConfig(
-    filename=log_file,
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-
-# Redirect stdout and stderr to logger
-logger = logging.getLogger(__name__)
-sys.stdout = StreamToLogger(logger, logging.INFO)
-sys.stderr = StreamToLogger(logger, logging.ERROR)
-
-
-log_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
-os.makedirs(log_dir, exist_ok=True)
-
-log_file = os.path.join(log_dir, 'logFile.log')
-
-logging.basicConfig(
-    filename=log_file,
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-
+from util.passwords import password_pool, PasswordPoolBusy, busy_response
+from util.tokens import issue_tokens, rotate_refresh_token, revoke_refresh_token, RefreshTokenError
 
 
 class AuthController:
@@ -74,20 +26,20 @@ class AuthController:
             if not user:
                 return jsonify({'error': 'Invalid email or password'}), 401
 
-            # Check password
-            if not user.check_password(data['mot_de_passe']):
+            # Check password (off-thread); upgrade the hash if the work factor changed
+            valid, rehash = password_pool.verify(data['mot_de_passe'], user.mot_de_passe)
+            if not valid:
                 return jsonify({'error': 'Invalid email or password'}), 401
+            if rehash:
+                user.mot_de_passe = rehash
+                db.session.commit()
 
-            # Generate token
-            token_payload = {
-                'user_id': user.id,
-                'email': user.email,
-                'exp': datetime.now(timezone.utc) + timedelta(hours=1)
-            }
-            token = jwt.encode(token_payload, current_app.config['SECRET_KEY'], algorithm='HS256')
+            # Short-lived access token + rotating refresh token
+            tokens = issue_tokens('user', user.id, user.email)
+            db.session.commit()
 
             return jsonify({
-                'token': token,
+                **tokens,
                 'user': {
                     'id': user.id,
                     'nom': user.nom,
@@ -97,6 +49,8 @@ class AuthController:
                 }
             }), 200
 
+        except PasswordPoolBusy:
+            return busy_response()
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -125,26 +79,67 @@ class AuthController:
                 logging.warning(f"Failed login attempt - Email not found: {email} from IP: {ip_address}")
                 return jsonify({'error': 'Invalid email or password'}), 401
 
-            # Check password
-            if not admin.check_password(data['mot_de_passe']):
+            # Check password (off-thread); upgrade the hash if the work factor changed
+            valid, rehash = password_pool.verify(data['mot_de_passe'], admin.mot_de_passe)
+            if not valid:
                 # Log failed attempt (wrong password)
                 logging.warning(f"Failed login attempt - Wrong password for: {email} from IP: {ip_address}")
                 return jsonify({'error': 'Invalid email or password'}), 401
 
+            if rehash:
+                admin.mot_de_passe = rehash
+                db.session.commit()
+
             # Log successful attempt
             logging.info(f"Successful admin login: {email} from IP: {ip_address}")
 
-            # Generate token for admin
-            token_payload = {
-                'admin_id': admin.id,
-                'email': admin.email,
-                'is_admin': True,
-                'exp': datetime.now(timezone.utc) + timedelta(hours=1)
-            }
-            token = jwt.encode(token_payload, current_app.config['SECRET_KEY'], algorithm='HS256')
+            # Short-lived access token + rotating refresh token
+            tokens = issue_tokens('admin', admin.id, admin.email)
+            db.session.commit()
 
-            return jsonify({'token': token}), 200
+            return jsonify(tokens), 200
 
+        except PasswordPoolBusy:
+            return busy_response()
         except Exception as e:
             logging.error(f"Admin login error: {str(e)}")
             return jsonify({'error': str(e)}), 500
+
+    @staticmethod
+    @limiter.limit("30 per minute", methods=["POST"])
+    def refresh_token():
+        """Exchange a refresh token for a new access token and a new refresh token"""
+        try:
+            data = request.get_json(silent=True) or {}
+            if not data.get('refresh_token'):
+                return jsonify({'error': 'Missing required field: refresh_token'}), 400
+
+            def email_of(kind, subject_id):
+                record = (User if kind == 'user' else Admin).query.filter_by(id=subject_id).first()
+                return record.email if record else None
+
+            tokens = rotate_refresh_token(data['refresh_token'], email_of)
+            db.session.commit()
+            return jsonify(tokens), 200
+
+        except RefreshTokenError as e:
+            return jsonify({'error': str(e)}), 401
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+
+    @staticmethod
+    def logout():
+        """Revoke the login session of a refresh token, including its live access tokens"""
+        try:
+            data = request.get_json(silent=True) or {}
+            if not data.get('refresh_token'):
+                return jsonify({'error': 'Missing required field: refresh_token'}), 400
+            if not revoke_refresh_token(data['refresh_token']):
+                return jsonify({'error': 'Invalid refresh token'}), 401
+            db.session.commit()
+            return jsonify({'message': 'Logged out'}), 200
+
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
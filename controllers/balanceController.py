@@ -1,56 +1,38 @@
 from flask import jsonify, request
 from extension import db
 from controllers.userController import UserController
-from models import User, Transaction, TransactionStatus, MinRetrait, Parrainage
+from models import User, Transaction, TransactionStatus, MinRetrait, Parrainage, UserBalance, ReferralClosure, \
+    create_referral_gains, settle_referral_gains
+from sqlalchemy import and_, func
+from sqlalchemy.orm import joinedload
 import os
 import uuid
 from werkzeug.utils import secure_filename
-
+from datetime import datetime
 from util.auth_utils import admin_required
-from utils import generate_id
+from util.pagination import keyset_paginate, PaginationError
+from util.deferred import deferred_jobs
 
 
 class BalanceController:
     @staticmethod
     def get_balance(user_id):
         """Get user balance: recharges + gains - retraits"""
-        recharges = db.session.query(db.func.sum(Transaction.montant)).filter(
-            Transaction.user_id == user_id, Transaction.action == 'recharge', Transaction.status == TransactionStatus.COMPLETED
-        ).scalar() or 0
-        retraits = db.session.query(db.func.sum(Transaction.montant)).filter(
-            Transaction.user_id == user_id, Transaction.action == 'retrait', Transaction.status != TransactionStatus.FAILED
-        ).scalar() or 0
-        gains = db.session.query(db.func.sum(Transaction.montant)).filter(
-            Transaction.user_id == user_id, Transaction.action == 'gain', Transaction.status == TransactionStatus.COMPLETED
-        ).scalar() or 0
-        balance = float(recharges) + float(gains) - float(retraits)
+        balance = UserController.get_balance(user_id)
         return jsonify({'balance': balance}), 200
 
     @staticmethod
-    def add_gain(user_id, montant, commentaire, idNewUser):
-        try:
-            generatedID= generate_id()
-            transaction = Transaction(
-                id = generatedID,
-                user_id=user_id,
-                action='gain',
-                montant=float(montant),
-                commentaire=commentaire,
-                status=TransactionStatus.PENDING
-            )
-            db.session.add(transaction)
-            parrainage = Parrainage(
-                idTransaction = generatedID,
-                idNewUser = idNewUser,
-                idOldUser = user_id,
-                montant=  montant
-            )
-            db.session.add(parrainage)
-            db.session.commit()
-            return True
-        except:
-            pass
-            return False
+    def settle_referrals():
+        """Create missing referral gains, then settle those whose recharge was decided; safe to rerun"""
+        with db.engine.begin() as connection:
+            created = create_referral_gains(connection)
+            settled = settle_referral_gains(connection)
+        return {'created': created, 'settled': settled}
+
+    @staticmethod
+    def schedule_referral_settlement():
+        """Run settle_referrals once the current request is done"""
+        deferred_jobs.submit('referral_settlement', BalanceController.settle_referrals)
 
     @staticmethod
     def add_transaction(user_id): #recharge transaction
@@ -101,7 +83,8 @@ class BalanceController:
 
         user = User.query.filter_by(id=user_id).first()
         if user.code_parrainage:
-            BalanceController.add_gain(user.code_parrainage, 0.1*float(montant), "Parrainage", user_id)
+            # The referrer's gain is created by the deferred settlement job
+            BalanceController.schedule_referral_settlement()
 
         return jsonify({
             'message': 'Recharge transaction added (pending approval)',
@@ -177,16 +160,7 @@ class BalanceController:
         if not user:
             return jsonify({'error': 'User not found'}), 404
 
-        recharges = db.session.query(db.func.sum(Transaction.montant)).filter(
-            Transaction.user_id == user_id, Transaction.action == 'recharge', Transaction.status == TransactionStatus.COMPLETED
-        ).scalar() or 0
-        retraits = db.session.query(db.func.sum(Transaction.montant)).filter(
-            Transaction.user_id == user_id, Transaction.action == 'retrait', Transaction.status != TransactionStatus.FAILED
-        ).scalar() or 0
-        gains = db.session.query(db.func.sum(Transaction.montant)).filter(
-            Transaction.user_id == user_id, Transaction.action == 'gain', Transaction.status == TransactionStatus.COMPLETED
-        ).scalar() or 0
-        balance = float(recharges) + float(gains) - float(retraits)
+        balance = UserController.get_balance(user_id)
 
         return jsonify({
             'user': {
@@ -200,17 +174,25 @@ class BalanceController:
     @staticmethod
     def get_total_earnings(user_id):
         """Total earnings (gains)"""
-        total = db.session.query(db.func.sum(Transaction.montant)).filter(
-            Transaction.user_id == user_id, Transaction.action == 'gain', Transaction.status == TransactionStatus.COMPLETED
-        ).scalar() or 0
+        ledger = db.session.get(UserBalance, user_id)
+        if ledger:
+            total = ledger.gains
+        else:
+            total = db.session.query(db.func.sum(Transaction.montant)).filter(
+                Transaction.user_id == user_id, Transaction.action == 'gain', Transaction.status == TransactionStatus.COMPLETED
+            ).scalar() or 0
         return jsonify({'total_earnings': float(total)}), 200
 
     @staticmethod
     def get_withdrawal_history(user_id):
-        """Withdrawal history, newest first"""
-        withdrawals = Transaction.query.filter(
-            Transaction.user_id == user_id, Transaction.action == 'retrait'
-        ).order_by(Transaction.date_transaction.desc()).all()
+        """Withdrawal history, newest first (?limit, ?cursor)"""
+        try:
+            withdrawals, next_cursor = keyset_paginate(
+                Transaction.query.filter(Transaction.user_id == user_id, Transaction.action == 'retrait'),
+                Transaction.date_transaction, Transaction.id
+            )
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
 
         history = []
         for t in withdrawals:
@@ -222,13 +204,18 @@ class BalanceController:
                 'status': t.status.value,
                 'action': t.action,
             })
-        return jsonify({'withdrawals': history}), 200
+        return jsonify({'withdrawals': history, 'next_cursor': next_cursor}), 200
 
     @staticmethod
     def get_transaction_history(user_id):
-        transactions = Transaction.query.filter(
-            Transaction.user_id == user_id
-        ).order_by(Transaction.date_transaction.desc()).all()
+        """Transaction history, newest first (?limit, ?cursor)"""
+        try:
+            transactions, next_cursor = keyset_paginate(
+                Transaction.query.filter(Transaction.user_id == user_id),
+                Transaction.date_transaction, Transaction.id
+            )
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
 
         history = []
         for t in transactions:
@@ -240,7 +227,7 @@ class BalanceController:
                 'date_transaction': t.date_transaction.isoformat(),
                 'status': t.status.value
             })
-        return jsonify({'transactions': history}), 200
+        return jsonify({'transactions': history, 'next_cursor': next_cursor}), 200
 
     @staticmethod
     def get_all_transaction_history():
@@ -261,10 +248,14 @@ class BalanceController:
     @staticmethod
     @admin_required
     def get_all_pending_transactions():
-        """Get all pending transactions (newest first)"""
-        transactions = Transaction.query.filter(
-            Transaction.status == TransactionStatus.PENDING
-        ).order_by(Transaction.date_transaction.desc()).all()
+        """Get pending transactions, newest first (?limit, ?cursor)"""
+        try:
+            transactions, next_cursor = keyset_paginate(
+                Transaction.query.filter(Transaction.status == TransactionStatus.PENDING),
+                Transaction.date_transaction, Transaction.id
+            )
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
         history = []
         for t in transactions:
             history.append({
@@ -274,9 +265,11 @@ class BalanceController:
                 'montant': float(t.montant),
                 'commentaire': t.commentaire,
                 'date_transaction': t.date_transaction.isoformat(),
-                'image_filename': t.image_filename
+                'image_filename': t.image_filename,
+                'version': t.version,
+                'claimed_by': t.claimed_by if t.claim_expires_at and t.claim_expires_at > datetime.utcnow() else None
             })
-        return jsonify({'transactions': history}), 200
+        return jsonify({'transactions': history, 'next_cursor': next_cursor}), 200
 
 
     @staticmethod
@@ -334,7 +327,7 @@ class BalanceController:
 
     @staticmethod
     def getParainnage(user_id):
-        parrainages = Parrainage.query.filter_by(idOldUser=user_id).all()
+        parrainages = Parrainage.query.options(joinedload(Parrainage.new_user)).filter_by(idOldUser=user_id).all()
 
         result = []
         for parrainage in parrainages:
@@ -350,4 +343,46 @@ class BalanceController:
                     'idTransaction': parrainage.idTransaction
                 })
 
-        return jsonify({'parrainages': result}), 200
\ No newline at end of file
+        return jsonify({'parrainages': result}), 200
+
+    @staticmethod
+    def get_downline(user_id):
+        """Referral downline per level: members and completed referral gains (?max_depth)"""
+        max_depth = request.args.get('max_depth', type=int)
+        if max_depth is not None and max_depth < 1:
+            return jsonify({'error': 'max_depth must be a positive integer'}), 400
+
+        levels = db.select(ReferralClosure.depth, func.count(ReferralClosure.descendant_id).label('members')) \
+            .where(ReferralClosure.ancestor_id == user_id, ReferralClosure.depth > 0) \
+            .group_by(ReferralClosure.depth)
+        # Gains paid for members of each level, i.e. to their direct referrer one level up
+        gains = db.select(
+            ReferralClosure.depth,
+            func.count(Parrainage.idParainnage).label('nb'),
+            func.coalesce(func.sum(Parrainage.montant), 0).label('total')
+        ).join(Parrainage, and_(
+            Parrainage.idNewUser == ReferralClosure.descendant_id,
+            Parrainage.statut == TransactionStatus.COMPLETED
+        )).where(ReferralClosure.ancestor_id == user_id, ReferralClosure.depth > 0) \
+            .group_by(ReferralClosure.depth)
+        if max_depth is not None:
+            levels = levels.where(ReferralClosure.depth <= max_depth)
+            gains = gains.where(ReferralClosure.depth <= max_depth)
+
+        earnings = {row.depth: row for row in db.session.execute(gains)}
+        result = []
+        for row in db.session.execute(levels.order_by(ReferralClosure.depth)):
+            level_gains = earnings.get(row.depth)
+            result.append({
+                'depth': row.depth,
+                'members': row.members,
+                'gains_count': level_gains.nb if level_gains else 0,
+                'gains': float(level_gains.total) if level_gains else 0.0
+            })
+
+        return jsonify({
+            'user_id': user_id,
+            'levels': result,
+            'total_members': sum(level['members'] for level in result),
+            'total_gains': sum(level['gains'] for level in result)
+        }), 200
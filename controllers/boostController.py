@@ -1,5 +1,7 @@
 import os
 from flask import jsonify, request, current_app
+from sqlalchemy import update
+from sqlalchemy.orm import joinedload, selectinload
 from werkzeug.utils import secure_filename
 
 from controllers.userController import UserController
@@ -7,9 +9,19 @@ from extension import db
 from models import Boost, BoostStatut, Commande, Transaction, TransactionStatus, StatProduitBoost, \
     StatProduitBoostTypePreuve, StatProduitBoostStatut
 from util.auth_utils import user_required, admin_required
+from util.pagination import keyset_paginate, next_page_headers, PaginationError
 from utils import generate_id
 
 
+def boost_graph_options():
+    """Load boost.user, boost.commande and boost.stats[*].produit up front (3 statements total)"""
+    return (
+        joinedload(Boost.user),
+        joinedload(Boost.commande),
+        selectinload(Boost.stats).joinedload(StatProduitBoost.produit)
+    )
+
+
 class BoostController:
     @staticmethod
     @user_required
@@ -110,7 +122,7 @@ class BoostController:
 
     @staticmethod
     def get_boost_details(idBoost):
-        boost = Boost.query.get(idBoost)
+        boost = Boost.query.options(*boost_graph_options()).get(idBoost)
         if not boost:
             return jsonify({'error': 'Boost not found'}), 404
 
@@ -157,7 +169,15 @@ class BoostController:
     @staticmethod
     @admin_required
     def get_all_boosts():
-        boosts = Boost.query.filter(Boost.statut.in_([BoostStatut.A_VALIDE, BoostStatut.EN_COURS])).all()
+        try:
+            boosts, next_cursor = keyset_paginate(
+                Boost.query.options(*boost_graph_options()).filter(
+                    Boost.statut.in_([BoostStatut.A_VALIDE, BoostStatut.EN_COURS])
+                ),
+                Boost.date, Boost.idBoost
+            )
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
         results = []
 
         for boost in boosts:
@@ -193,14 +213,20 @@ class BoostController:
                 'statut': boost.statut.value
             })
 
-        return jsonify(results), 200
+        return jsonify(results), 200, next_page_headers(next_cursor)
 
     @staticmethod
     def get_boosts_by_status(status):
         if status not in [s.value for s in BoostStatut]:
             return jsonify({'error': 'Invalid status'}), 400
 
-        boosts = Boost.query.filter_by(statut=BoostStatut(status)).all()
+        try:
+            boosts, next_cursor = keyset_paginate(
+                Boost.query.options(*boost_graph_options()).filter_by(statut=BoostStatut(status)),
+                Boost.date, Boost.idBoost
+            )
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
         results = []
 
         for boost in boosts:
@@ -230,7 +256,7 @@ class BoostController:
                 'statProduitBoost': stat_produits
             })
 
-        return jsonify(results), 200
+        return jsonify(results), 200, next_page_headers(next_cursor)
 
     @staticmethod
     def get_commande_details(idCommande):
@@ -239,7 +265,13 @@ class BoostController:
             return jsonify({'error': 'Commande not found'}), 404
 
         # Get all boosts for this commande
-        boosts = Boost.query.filter_by(idCommande=idCommande).all()
+        try:
+            boosts, next_cursor = keyset_paginate(
+                Boost.query.options(*boost_graph_options()).filter_by(idCommande=idCommande),
+                Boost.date, Boost.idBoost
+            )
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
         boost_results = []
 
         for boost in boosts:
@@ -271,7 +303,8 @@ class BoostController:
             'date': commande.date.isoformat(),
             'commission_total': float(commande.commission_total) if commande.commission_total else 0,
             'cout': float(commande.cout) if commande.cout else 0,
-            'boosts': boost_results
+            'boosts': boost_results,
+            'next_cursor': next_cursor
         }), 200
 
     @staticmethod
@@ -287,38 +320,42 @@ class BoostController:
             if not data:
                 return jsonify({'error': 'No data provided'}), 400
             boost = Boost.query.get(idBoost)
-            if boost.statut==BoostStatut.A_VALIDE:
-                boost.statut = BoostStatut.EN_COURS
-                trans = Transaction.query.get(boost.transaction_id)
-                if trans:
-                    trans.status = TransactionStatus.COMPLETED
+            if not boost:
+                return jsonify({'error': 'Boost not found'}), 404
 
-            updated_stats = []
             errors = []
-
+            items = {}
             for item in data:
                 id_stat = item.get('idStat')
                 if not id_stat:
                     errors.append(f'Missing idStat for item')
                     continue
+                items[id_stat] = item
+
+            # One IN query, scoped to this boost so foreign idStat values come back as missing
+            current = {
+                row.idStatProduitBoost: row
+                for row in db.session.query(
+                    StatProduitBoost.idStatProduitBoost,
+                    StatProduitBoost.cout,
+                    StatProduitBoost.commission
+                ).filter(
+                    StatProduitBoost.idBoost == idBoost,
+                    StatProduitBoost.idStatProduitBoost.in_(list(items))
+                ).all()
+            } if items else {}
 
-                stat = StatProduitBoost.query.get(id_stat)
+            updated_stats = []
+            for id_stat, item in items.items():
+                stat = current.get(id_stat)
                 if not stat:
-                    errors.append(f'Stat with id {id_stat} not found')
+                    errors.append(f'Stat with id {id_stat} not found for boost {idBoost}')
                     continue
 
-                # Update cost
-                if 'cost' in item:
-                    stat.cout = item['cost']
-
-                # Update commission
-                if 'commission' in item:
-                    stat.commission = item['commission']
-
                 updated_stats.append({
-                    'idStat': stat.idStatProduitBoost,
-                    'cout': float(stat.cout),
-                    'commission': float(stat.commission),
+                    'idStat': id_stat,
+                    'cout': float(item['cost']) if 'cost' in item else float(stat.cout),
+                    'commission': float(item['commission']) if 'commission' in item else float(stat.commission),
                 })
 
             if errors:
@@ -328,6 +365,21 @@ class BoostController:
                     'details': errors
                 }), 400
 
+            if boost.statut==BoostStatut.A_VALIDE:
+                boost.statut = BoostStatut.EN_COURS
+                trans = Transaction.query.get(boost.transaction_id)
+                if trans:
+                    trans.status = TransactionStatus.COMPLETED
+
+            # Single executemany UPDATE keyed on the primary key
+            db.session.execute(update(StatProduitBoost), [
+                {
+                    'idStatProduitBoost': stat['idStat'],
+                    'cout': stat['cout'],
+                    'commission': stat['commission']
+                }
+                for stat in updated_stats
+            ])
             db.session.commit()
 
             return jsonify({
@@ -351,7 +403,13 @@ class BoostController:
     @user_required
     def get_boosts_user():
         user_id = request.user.id
-        boosts = Boost.query.filter_by(idUtilisateur = user_id).all()
+        try:
+            boosts, next_cursor = keyset_paginate(
+                Boost.query.options(*boost_graph_options()).filter_by(idUtilisateur=user_id),
+                Boost.date, Boost.idBoost
+            )
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
         results = []
 
         for boost in boosts:
@@ -390,7 +448,7 @@ class BoostController:
                 'statut': boost.statut.value,
             })
 
-        return jsonify(results), 200
+        return jsonify(results), 200, next_page_headers(next_cursor)
 
     @staticmethod
     @user_required
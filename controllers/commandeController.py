@@ -2,13 +2,14 @@ from datetime import datetime
 
 from flask import jsonify, request
 from extension import db
-from models import Commande, CommandeStatut, Produit, Revendeur
+from models import Commande, CommandeStatut, CommandeProduit, Produit, Revendeur
 import os
 import uuid
 import json
 from werkzeug.utils import secure_filename
 
 from util.auth_utils import admin_required
+from util.pagination import keyset_paginate, PaginationError
 from utils import generate_id
 
 class CommandeController:
@@ -80,33 +81,56 @@ class CommandeController:
 
     @staticmethod
     def list_commandes():
-        commandes = Commande.query.all()
+        """List commandes newest first (?limit, ?cursor, optional ?statut)"""
+        query = Commande.query
+
+        statut = request.args.get('statut')
+        if statut:
+            try:
+                statut = CommandeStatut[statut] if statut in CommandeStatut.__members__ else CommandeStatut(statut)
+            except ValueError:
+                return jsonify({'error': f'statut invalide. Valeurs possibles: {[s.value for s in CommandeStatut]}'}), 400
+            query = query.filter(Commande.statut == statut)
+
+        try:
+            commandes, next_cursor = keyset_paginate(query, Commande.date, Commande.idCommande)
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # Products of every commande in one join over commande_produits
+        produits_by_commande = {}
+        if commandes:
+            rows = db.session.query(
+                CommandeProduit.idCommande,
+                Produit.idProduit,
+                Produit.nom_produit,
+                Produit.prix
+            ).join(
+                Produit, Produit.idProduit == CommandeProduit.idProduit
+            ).filter(
+                CommandeProduit.idCommande.in_([c.idCommande for c in commandes])
+            ).order_by(CommandeProduit.idCommande, CommandeProduit.position).all()
+            for row in rows:
+                produits_by_commande.setdefault(row.idCommande, []).append({
+                    'id': row.idProduit,
+                    'name': row.nom_produit,
+                    'price': str(row.prix)
+                })
+
         result = []
         for commande in commandes:
-            # Fetch product details from DB using idProduits
-            processed_produits = []
-            if commande.tableauProduit:
-                for prod_id in commande.tableauProduit:
-                    produit = Produit.query.filter_by(idProduit=prod_id).first()
-                    if produit:
-                        processed_produits.append({
-                            'id': produit.idProduit,
-                            'name': produit.nom_produit,
-                            'price': str(produit.prix)
-                        })
-
             result.append({
                 'idCommande': commande.idCommande,
                 'description_commande': commande.description_commande,
                 'code': commande.code,
                 'commission_total': commande.commission_total,
                 'cout': commande.cout,
-                'tableauProduit': processed_produits,
+                'tableauProduit': produits_by_commande.get(commande.idCommande, []),
                 'statut': commande.statut.value,
                 'image': commande.image,
                 'date': commande.date
             })
-        return jsonify({'commandes': result})
+        return jsonify({'commandes': result, 'next_cursor': next_cursor})
 
     @staticmethod
     @admin_required
@@ -203,30 +227,35 @@ class CommandeController:
         if not commande:
             return jsonify({'error': 'Commande non trouvée'}), 404
 
-        # Produits complets
+        # Produits complets (avec leur revendeur) en une seule jointure
+        rows = db.session.query(
+            Produit,
+            Revendeur
+        ).join(
+            CommandeProduit, CommandeProduit.idProduit == Produit.idProduit
+        ).outerjoin(
+            Revendeur, Revendeur.id == Produit.revendeur_id
+        ).filter(
+            CommandeProduit.idCommande == idCommande
+        ).order_by(CommandeProduit.position).all()
+
         produits = []
-        if commande.tableauProduit:
-            for prod_id in commande.tableauProduit:
-                produit = Produit.query.filter_by(idProduit=prod_id).first()
-                if produit:
-                    produits.append({
-                        'id': produit.idProduit,
-                        'image': produit.image_produit,
-                        'nom': produit.nom_produit,
-                        'linkProduit': produit.linkProduit,
-                        'prix': str(produit.prix)
-                    })
+        for produit, _ in rows:
+            produits.append({
+                'id': produit.idProduit,
+                'image': produit.image_produit,
+                'nom': produit.nom_produit,
+                'linkProduit': produit.linkProduit,
+                'prix': str(produit.prix)
+            })
 
         # Revendeur du premier produit
         revendeur = None
-        if produits:
-            first_prod_id = commande.tableauProduit[0]
-            first_produit = Produit.query.filter_by(idProduit=first_prod_id).first()
-            if first_produit and first_produit.revendeur:
-                revendeur = {
-                    'nom': first_produit.revendeur.nom,
-                    'plateforme': first_produit.revendeur.plateforme
-                }
+        if rows and rows[0][1]:
+            revendeur = {
+                'nom': rows[0][1].nom,
+                'plateforme': rows[0][1].plateforme
+            }
 
         return jsonify({
             'commande': {
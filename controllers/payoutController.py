@@ -0,0 +1,182 @@
+from datetime import datetime
+from flask import jsonify, request
+from sqlalchemy import func, or_, select
+from werkzeug.utils import secure_filename
+from models import Transaction, TransactionStatus, ConfigRetrait, PayoutBatch, User
+from extension import db
+from util.auth_utils import admin_required
+from util.export import stream_export, EXPORT_FORMATS
+from util.pagination import keyset_paginate, PaginationError
+
+
+def payable_withdrawals(table, now):
+    """Pending withdrawals not yet in a payout batch nor held under a review lease"""
+    return (
+        table.c.action == 'retrait',
+        table.c.status == TransactionStatus.PENDING,
+        table.c.payout_batch_id.is_(None),
+        or_(table.c.claim_expires_at.is_(None), table.c.claim_expires_at < now)
+    )
+
+
+class PayoutController:
+
+    @staticmethod
+    def _serialize_batch(batch):
+        return {
+            'idBatch': batch.idBatch,
+            'coin': batch.coin,
+            'reseau': batch.reseau,
+            'nbTransactions': batch.nbTransactions,
+            'montantTotal': float(batch.montantTotal),
+            'createdBy': batch.createdBy,
+            'date': batch.date.isoformat() if batch.date else None
+        }
+
+    @staticmethod
+    @admin_required
+    def get_pending_groups():
+        """Payable withdrawals per (coin, reseau), in one query joined to config_retraits"""
+        try:
+            table = Transaction.__table__
+            rows = db.session.execute(
+                select(
+                    ConfigRetrait.coin,
+                    ConfigRetrait.reseau,
+                    func.count(table.c.id).label('nb'),
+                    func.coalesce(func.sum(table.c.montant), 0).label('total')
+                )
+                .select_from(table)
+                .join(ConfigRetrait, ConfigRetrait.userId == table.c.user_id)
+                .where(*payable_withdrawals(table, datetime.utcnow()))
+                .group_by(ConfigRetrait.coin, ConfigRetrait.reseau)
+                .order_by(ConfigRetrait.coin, ConfigRetrait.reseau)
+            ).all()
+
+            return jsonify({'groups': [{
+                'coin': row.coin,
+                'reseau': row.reseau,
+                'nbTransactions': row.nb,
+                'montantTotal': float(row.total)
+            } for row in rows]}), 200
+
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    @staticmethod
+    @admin_required
+    def create_batches():
+        """Put every payable withdrawal into one batch per (coin, reseau), optionally for one coin/reseau only.
+
+        Each group is claimed with a single set-based UPDATE that also snapshots the
+        user's deposit address into recipient_address, and all groups commit together.
+        """
+        try:
+            data = request.get_json(silent=True) or {}
+            now = datetime.utcnow()
+            table = Transaction.__table__
+            config = ConfigRetrait.__table__
+
+            groups = select(config.c.coin, config.c.reseau) \
+                .select_from(table) \
+                .join(config, config.c.userId == table.c.user_id) \
+                .where(*payable_withdrawals(table, now)) \
+                .group_by(config.c.coin, config.c.reseau)
+            if data.get('coin'):
+                groups = groups.where(config.c.coin == data['coin'])
+            if data.get('reseau'):
+                groups = groups.where(config.c.reseau == data['reseau'])
+
+            address = select(config.c.depositAdress) \
+                .where(config.c.userId == table.c.user_id) \
+                .limit(1) \
+                .scalar_subquery()
+
+            batches = []
+            for coin, reseau in db.session.execute(groups).all():
+                batch = PayoutBatch(coin=coin, reseau=reseau, createdBy=request.admin.id)
+                db.session.add(batch)
+                db.session.flush()
+
+                db.session.execute(
+                    table.update()
+                    .where(
+                        *payable_withdrawals(table, now),
+                        table.c.user_id.in_(
+                            select(config.c.userId).where(config.c.coin == coin, config.c.reseau == reseau)
+                        )
+                    )
+                    .values(payout_batch_id=batch.idBatch, recipient_address=address, version=table.c.version + 1)
+                )
+
+                nb, total = db.session.execute(
+                    select(func.count(table.c.id), func.coalesce(func.sum(table.c.montant), 0))
+                    .where(table.c.payout_batch_id == batch.idBatch)
+                ).one()
+                if not nb:
+                    # Another run took these rows between the grouping read and the UPDATE
+                    db.session.delete(batch)
+                    continue
+                batch.nbTransactions = nb
+                batch.montantTotal = total
+                batches.append(batch)
+
+            db.session.commit()
+            return jsonify({'batches': [PayoutController._serialize_batch(b) for b in batches]}), 201
+
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+
+    @staticmethod
+    @admin_required
+    def list_batches():
+        """Payout batches, newest first (?limit, ?cursor)"""
+        try:
+            batches, next_cursor = keyset_paginate(PayoutBatch.query, PayoutBatch.date, PayoutBatch.idBatch)
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({
+            'batches': [PayoutController._serialize_batch(b) for b in batches],
+            'next_cursor': next_cursor
+        }), 200
+
+    @staticmethod
+    @admin_required
+    def export_batch(batch_id):
+        """Stream the payout file of a batch as CSV or NDJSON (?format, csv by default)"""
+        export_format = request.args.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': 'Invalid format. Must be ndjson or csv'}), 400
+
+        batch = db.session.get(PayoutBatch, batch_id)
+        if not batch:
+            return jsonify({'error': 'Payout batch not found'}), 404
+
+        query = db.select(
+            Transaction.id,
+            Transaction.user_id,
+            User.nom.label('user_nom'),
+            User.email.label('user_email'),
+            Transaction.recipient_address,
+            Transaction.montant,
+            Transaction.status,
+            Transaction.date_transaction
+        ).outerjoin(User, User.id == Transaction.user_id) \
+            .where(Transaction.payout_batch_id == batch_id) \
+            .order_by(Transaction.id)
+
+        columns = ['transaction_id', 'user_id', 'user_nom', 'user_email', 'adresse', 'coin', 'reseau',
+                   'montant', 'status', 'date']
+        coin, reseau = batch.coin, batch.reseau
+
+        def serialize(row):
+            return [
+                row.id, row.user_id, row.user_nom, row.user_email, row.recipient_address, coin, reseau,
+                float(row.montant), row.status.value,
+                row.date_transaction.strftime('%Y-%m-%d %H:%M:%S') if row.date_transaction else None
+            ]
+
+        # coin/reseau come from admin-entered config: keep only filename-safe characters
+        filename = secure_filename(f"payout_{coin}_{reseau}_{batch_id}.{export_format}")
+        return stream_export(query, columns, serialize, export_format, filename)
@@ -7,7 +7,10 @@ from flask import jsonify, request, current_app
 from werkzeug.utils import secure_filename
 from extension import db
 from models import Revendeur, Produit, Commande, CommandeStatut, Boost, StatProduitBoost, StatProduitBoostStatut, StatProduitBoostTypePreuve, User
+from sqlalchemy.orm import joinedload
 from util.auth_utils import admin_required
+from util.pagination import keyset_paginate, PaginationError
+from util.singleflight import aggregate_cache
 from utils import generate_id
 
 class ProductController:
@@ -306,41 +309,9 @@ class ProductController:
 
     @staticmethod
     def get_top_boosts():
-        """Top 5 produits by StatProduitBoost count with explicit joins"""
+        """Top 5 produits by StatProduitBoost count (shared single-flight cache)"""
         try:
-            from sqlalchemy import func, desc
-
-            # Query with explicit join condition and proper aliasing
-            query = db.session.query(
-                Produit.idProduit,
-                Produit.nom_produit,
-                Produit.image_produit,
-                Produit.prix,
-                Produit.linkProduit,
-                func.count(StatProduitBoost.idStatProduitBoost).label('boost_count')
-            ).outerjoin(
-                StatProduitBoost,
-                Produit.idProduit == StatProduitBoost.idProduit
-            ).group_by(
-                Produit.idProduit
-            ).order_by(
-                desc('boost_count')
-            ).limit(5)
-
-            # Execute query
-            results = query.all()
-
-            # Format results with null safety
-            top_products = []
-            for row in results:
-                top_products.append({
-                    'idProduit': row.idProduit,
-                    'nom_produit': row.nom_produit or 'N/A',
-                    'image_produit': row.image_produit or '',
-                    'prix': float(row.prix) if row.prix else 0.0,
-                    'linkProduit': row.linkProduit or '',
-                    'countStatProduitBoost': row.boost_count or 0
-                })
+            top_products = aggregate_cache.get('top_boosts', ProductController.compute_top_boosts)
 
             return jsonify({
                 'success': True,
@@ -360,56 +331,41 @@ class ProductController:
             # Ensure session is closed
             db.session.close()
 
+    @staticmethod
+    def compute_top_boosts():
+        # Index scan on ix_produits_boost_count, no aggregation over stat_produit_boost
+        query = db.session.query(
+            Produit.idProduit,
+            Produit.nom_produit,
+            Produit.image_produit,
+            Produit.prix,
+            Produit.linkProduit,
+            Produit.boost_count
+        ).order_by(
+            Produit.boost_count.desc()
+        ).limit(5)
+
+        # Format results with null safety
+        top_products = []
+        for row in query.all():
+            top_products.append({
+                'idProduit': row.idProduit,
+                'nom_produit': row.nom_produit or 'N/A',
+                'image_produit': row.image_produit or '',
+                'prix': float(row.prix) if row.prix else 0.0,
+                'linkProduit': row.linkProduit or '',
+                'countStatProduitBoost': row.boost_count or 0
+            })
+        return top_products
+
     @staticmethod
     def get_all_produits_with_boost_count():
-        """List all produits with their boost count"""
+        """List all produits with their boost count (shared single-flight cache)"""
         try:
-            from sqlalchemy import func, desc
-
-            # Query all produits with boost count
-            query = db.session.query(
-                Produit.idProduit,
-                Produit.nom_produit,
-                Produit.image_produit,
-                Produit.prix,
-                Produit.linkProduit,
-                Produit.description_produit,
-                Produit.commission,
-                Revendeur.nom.label('revendeur_nom'),
-                Revendeur.plateforme.label('revendeur_plateforme'),
-                func.count(StatProduitBoost.idStatProduitBoost).label('boost_count')
-            ).outerjoin(
-                StatProduitBoost,
-                Produit.idProduit == StatProduitBoost.idProduit
-            ).join(
-                Revendeur,
-                Produit.revendeur_id == Revendeur.id
-            ).group_by(
-                Produit.idProduit,
-                Revendeur.nom
-            ).order_by(
-                desc('boost_count')
+            produits_with_boost = aggregate_cache.get(
+                'produits_with_boost_count', ProductController.compute_produits_with_boost_count
             )
 
-            # Execute query
-            results = query.all()
-
-            # Format results with null safety
-            produits_with_boost = []
-            for row in results:
-                produits_with_boost.append({
-                    'idProduit': row.idProduit,
-                    'nom_produit': row.nom_produit or 'N/A',
-                    'description_produit': row.description_produit or '',
-                    'image_produit': row.image_produit or '',
-                    'prix': float(row.prix) if row.prix else 0.0,
-                    'commission': float(row.commission) if row.commission else 0.0,
-                    'linkProduit': row.linkProduit or '',
-                    'revendeur': row.revendeur_nom if row.revendeur_nom else 'Unknown',
-                    'boost_count': row.boost_count or 0,
-                    'plateforme': row.revendeur_plateforme
-                })
-
             return jsonify({
                 'success': True,
                 'produits': produits_with_boost,
@@ -428,10 +384,51 @@ class ProductController:
             # Ensure session is closed
             db.session.close()
 
+    @staticmethod
+    def compute_produits_with_boost_count():
+        # Query all produits, ranked by their maintained boost_count
+        query = db.session.query(
+            Produit.idProduit,
+            Produit.nom_produit,
+            Produit.image_produit,
+            Produit.prix,
+            Produit.linkProduit,
+            Produit.description_produit,
+            Produit.commission,
+            Produit.boost_count,
+            Revendeur.nom.label('revendeur_nom'),
+            Revendeur.plateforme.label('revendeur_plateforme')
+        ).join(
+            Revendeur,
+            Produit.revendeur_id == Revendeur.id
+        ).order_by(
+            Produit.boost_count.desc()
+        )
+
+        # Format results with null safety
+        produits_with_boost = []
+        for row in query.all():
+            produits_with_boost.append({
+                'idProduit': row.idProduit,
+                'nom_produit': row.nom_produit or 'N/A',
+                'description_produit': row.description_produit or '',
+                'image_produit': row.image_produit or '',
+                'prix': float(row.prix) if row.prix else 0.0,
+                'commission': float(row.commission) if row.commission else 0.0,
+                'linkProduit': row.linkProduit or '',
+                'revendeur': row.revendeur_nom if row.revendeur_nom else 'Unknown',
+                'boost_count': row.boost_count or 0,
+                'plateforme': row.revendeur_plateforme
+            })
+        return produits_with_boost
+
     @staticmethod
     def get_all_produits():
+        """List produits (?limit, ?cursor)"""
         try:
-            produits = Produit.query.all()
+            produits, next_cursor = keyset_paginate(
+                Produit.query.options(joinedload(Produit.revendeur)), None, Produit.idProduit
+            )
             list_produits = []
             for p in produits:
                 list_produits.append({
@@ -444,6 +441,8 @@ class ProductController:
                     'linkProduit': p.linkProduit,
                     'revendeur': p.revendeur.nom if p.revendeur else None
                 })
-            return jsonify({'produits': list_produits}), 200
+            return jsonify({'produits': list_produits, 'next_cursor': next_cursor}), 200
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             return jsonify({'error': str(e)}), 500
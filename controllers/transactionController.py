@@ -1,10 +1,24 @@
-from flask import jsonify, request
-from models import Transaction, TransactionStatus, Parrainage
+import logging
+from datetime import datetime, timedelta
+from flask import jsonify, request, current_app
+from sqlalchemy import select, update, or_
+from sqlalchemy.orm.exc import StaleDataError
+from models import Transaction, TransactionStatus, Parrainage, track_bulk_transaction_changes
 from extension import db
+from controllers.balanceController import BalanceController
 from util.auth_utils import admin_required
 
+MAX_BATCH_SIZE = 500
+MAX_CLAIM_SIZE = 50
+
 class TransactionController:
 
+    @staticmethod
+    def _claimed_by_other(transaction):
+        """True while another admin holds a live review-queue lease on the transaction"""
+        return bool(transaction.claimed_by) and transaction.claimed_by != request.admin.id \
+            and transaction.claim_expires_at is not None and transaction.claim_expires_at > datetime.utcnow()
+
     @staticmethod
     @admin_required
     def update_transaction(transaction_id):
@@ -14,25 +28,38 @@ class TransactionController:
             if not transaction:
                 return jsonify({'error': 'Transaction not found'}), 404
 
-            data = request.get_json()
-            print(data['montant'])
+            data = request.get_json(silent=True) or {}
+            # Optional version check (required only on the review-queue endpoints); another admin's claim always wins
+            if 'version' in data and data['version'] != transaction.version:
+                return jsonify({'error': 'Transaction was modified by someone else', 'version': transaction.version}), 409
+            if TransactionController._claimed_by_other(transaction):
+                return jsonify({'error': 'Transaction is claimed by another admin'}), 409
             if 'montant' in data:
                 transaction.montant = float(data['montant'])
 
             if 'status' in data:
-                print(data['status'])
                 # Assume status is string matching TransactionStatus values
                 valid_statuses = [s.name for s in TransactionStatus]
                 if data['status'] not in valid_statuses:
                     return jsonify({'error': f'Invalid status. Must be one of: {valid_statuses}'}), 400
                 transaction.status = data['status']  # or TransactionStatus[data['status']]
+                # A decision ends the caller's own claim, as in decide_review_item
+                transaction.claimed_by = None
+                transaction.claim_expires_at = None
 
             if 'commentaire' in data:
                 transaction.commentaire = data['commentaire']
 
             db.session.commit()
-            return jsonify({'message': 'Transaction updated successfully', 'transaction_id': transaction_id}), 200
+            logging.debug("update_transaction %s changed %s", transaction_id,
+                          [name for name in ('montant', 'status', 'commentaire') if name in data])
+            if transaction.action == 'recharge':
+                BalanceController.schedule_referral_settlement()
+            return jsonify({'message': 'Transaction updated successfully', 'transaction_id': transaction_id, 'version': transaction.version}), 200
 
+        except StaleDataError:
+            db.session.rollback()
+            return jsonify({'error': 'Transaction was modified by someone else'}), 409
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
@@ -50,7 +77,6 @@ class TransactionController:
 
             if 'montant' in data:
                 parrainage.montant = float(data['montant'])
-                print(data['montant'], data['status'])
 
             if 'status' in data:
                 valid_statuses = [s.name for s in TransactionStatus]
@@ -60,13 +86,275 @@ class TransactionController:
 
                 # Update linked transaction status
                 transaction = Transaction.query.filter_by(id=parrainage.idTransaction).first()
+                if transaction and TransactionController._claimed_by_other(transaction):
+                    db.session.rollback()
+                    return jsonify({'error': 'Transaction is claimed by another admin'}), 409
                 if transaction:
                     transaction.status = data['status']
                     transaction.montant = float(data['montant'])
 
             db.session.commit()
+            logging.debug("update_parrainage %s changed %s", parrainage_id,
+                          [name for name in ('montant', 'status') if name in data])
             return jsonify({'message': 'Parrainage updated successfully', 'parrainage_id': parrainage_id}), 200
 
+        except StaleDataError:
+            db.session.rollback()
+            return jsonify({'error': 'Transaction was modified by someone else'}), 409
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+
+    @staticmethod
+    @admin_required
+    def batch_update_transactions():
+        """Approve or reject many pending transactions at once.
+
+        Body: {"items": [{"transaction_id": ..., "status": ..., "montant": optional}, ...]}
+        Valid items are applied together in one DB transaction, invalid ones are
+        reported in the per-item results and left untouched.
+        """
+        try:
+            data = request.get_json(silent=True) or {}
+            items = data.get('items')
+            if not isinstance(items, list) or not items:
+                return jsonify({'error': 'items must be a non-empty list'}), 400
+            if len(items) > MAX_BATCH_SIZE:
+                return jsonify({'error': f'At most {MAX_BATCH_SIZE} items per batch'}), 400
+
+            valid_statuses = [s.name for s in TransactionStatus]
+            results = []
+            requested = {}
+            for item in items:
+                transaction_id = item.get('transaction_id') if isinstance(item, dict) else None
+                result = {'transaction_id': transaction_id, 'ok': False}
+                results.append(result)
+                if not transaction_id:
+                    result['error'] = 'transaction_id is required'
+                elif transaction_id in requested:
+                    result['error'] = 'Duplicate transaction_id in batch'
+                elif item.get('status') not in valid_statuses:
+                    result['error'] = f'Invalid status. Must be one of: {valid_statuses}'
+                else:
+                    montant = None
+                    if item.get('montant') is not None:
+                        try:
+                            montant = float(item['montant'])
+                        except (TypeError, ValueError):
+                            result['error'] = 'Invalid montant'
+                            continue
+                    requested[transaction_id] = (result, TransactionStatus[item['status']], montant)
+
+            # One query validates every id and carries what the ledger/rollup need
+            rows = db.session.execute(
+                select(
+                    Transaction.id, Transaction.user_id, Transaction.action,
+                    Transaction.status, Transaction.montant, Transaction.date_transaction,
+                    Transaction.version, Transaction.claimed_by, Transaction.claim_expires_at,
+                    Parrainage.idParainnage
+                )
+                .outerjoin(Parrainage, Parrainage.idTransaction == Transaction.id)
+                .where(Transaction.id.in_(list(requested)))
+            ).all() if requested else []
+
+            found = {}
+            for row in rows:
+                entry = found.setdefault(row.id, {'row': row, 'parrainages': []})
+                if row.idParainnage:
+                    entry['parrainages'].append(row.idParainnage)
+
+            now = datetime.utcnow()
+            transaction_updates = []
+            parrainage_updates = []
+            changes = []
+            for transaction_id, (result, status, montant) in requested.items():
+                entry = found.get(transaction_id)
+                if not entry:
+                    result['error'] = 'Transaction not found'
+                    continue
+                row = entry['row']
+                if row.status != TransactionStatus.PENDING:
+                    result['error'] = f'Transaction is not pending ({row.status.name})'
+                    continue
+                if row.claimed_by and row.claimed_by != request.admin.id and row.claim_expires_at \
+                        and row.claim_expires_at > now:
+                    result['error'] = 'Transaction is claimed by another admin'
+                    continue
+
+                # The version makes the UPDATE fail if anyone touched the row since the validation read
+                values = {'id': transaction_id, 'version': row.version, 'status': status,
+                          'claimed_by': None, 'claim_expires_at': None}
+                if montant is not None:
+                    values['montant'] = montant
+                transaction_updates.append(values)
+                for parrainage_id in entry['parrainages']:
+                    parrainage_values = {'idParainnage': parrainage_id, 'statut': status}
+                    if montant is not None:
+                        parrainage_values['montant'] = montant
+                    parrainage_updates.append(parrainage_values)
+
+                before = {
+                    'user_id': row.user_id, 'action': row.action, 'status': row.status,
+                    'montant': row.montant, 'date_transaction': row.date_transaction
+                }
+                changes.append((before, dict(before, status=status, montant=row.montant if montant is None else montant)))
+                result.update(ok=True, status=status.name)
+
+            if transaction_updates:
+                db.session.execute(update(Transaction), transaction_updates)
+                if parrainage_updates:
+                    db.session.execute(update(Parrainage), parrainage_updates)
+                # Bulk UPDATEs skip the mapper events that keep these tables current
+                track_bulk_transaction_changes(db.session.connection(), changes)
+                db.session.commit()
+                if any(before['action'] == 'recharge' for before, _ in changes):
+                    BalanceController.schedule_referral_settlement()
+
+            return jsonify({'updated': len(transaction_updates), 'results': results}), 200
+
+        except StaleDataError:
+            db.session.rollback()
+            return jsonify({'error': 'Some transactions were modified concurrently, nothing was applied'}), 409
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+
+    @staticmethod
+    def _queue_item(transaction):
+        return {
+            'id': transaction.id,
+            'user_id': transaction.user_id,
+            'action': transaction.action,
+            'montant': float(transaction.montant),
+            'commentaire': transaction.commentaire,
+            'date_transaction': transaction.date_transaction.isoformat() if transaction.date_transaction else None,
+            'image_filename': transaction.image_filename,
+            'version': transaction.version,
+            'claim_expires_at': transaction.claim_expires_at.isoformat() if transaction.claim_expires_at else None
+        }
+
+    @staticmethod
+    @admin_required
+    def claim_review_queue():
+        """Reserve the oldest unclaimed pending transactions for the calling admin (?limit)"""
+        try:
+            limit = request.args.get('limit', 10, type=int)
+            if limit < 1:
+                return jsonify({'error': 'limit must be a positive integer'}), 400
+            limit = min(limit, MAX_CLAIM_SIZE)
+
+            now = datetime.utcnow()
+            expires_at = now + timedelta(seconds=current_app.config['REVIEW_LEASE_SECONDS'])
+            # Pending and either never claimed or whose lease has run out
+            query = (
+                select(Transaction.id, Transaction.version)
+                .where(
+                    Transaction.status == TransactionStatus.PENDING,
+                    or_(Transaction.claim_expires_at.is_(None), Transaction.claim_expires_at < now)
+                )
+                .order_by(Transaction.date_transaction, Transaction.id)
+                .limit(limit)
+            )
+            if db.session.get_bind().dialect.name == 'mysql':
+                # Concurrent claimers skip each other's locked rows instead of waiting on them
+                query = query.with_for_update(skip_locked=True)
+            candidates = db.session.execute(query).all()
+
+            # SQLite has no SKIP LOCKED: the version check drops rows another admin just claimed
+            table = Transaction.__table__
+            claimed_ids = []
+            for candidate in candidates:
+                result = db.session.execute(
+                    table.update()
+                    .where(table.c.id == candidate.id, table.c.version == candidate.version)
+                    .values(claimed_by=request.admin.id, claim_expires_at=expires_at, version=table.c.version + 1)
+                )
+                if result.rowcount == 1:
+                    claimed_ids.append(candidate.id)
+            db.session.commit()
+
+            transactions = Transaction.query.filter(Transaction.id.in_(claimed_ids)) \
+                .order_by(Transaction.date_transaction, Transaction.id).all() if claimed_ids else []
+            return jsonify({
+                'transactions': [TransactionController._queue_item(t) for t in transactions],
+                'lease_expires_at': expires_at.isoformat()
+            }), 200
+
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+
+    @staticmethod
+    def _claimed_transaction(transaction_id, data):
+        """The transaction if the caller holds a live lease on the version they read, else an error response"""
+        transaction = db.session.get(Transaction, transaction_id)
+        if not transaction:
+            return None, (jsonify({'error': 'Transaction not found'}), 404)
+        if transaction.claimed_by != request.admin.id or not transaction.claim_expires_at \
+                or transaction.claim_expires_at < datetime.utcnow():
+            return None, (jsonify({'error': 'No active claim on this transaction'}), 409)
+        if data.get('version') != transaction.version:
+            return None, (jsonify({'error': 'Transaction was modified by someone else', 'version': transaction.version}), 409)
+        return transaction, None
+
+    @staticmethod
+    @admin_required
+    def decide_review_item(transaction_id):
+        """Apply the claiming admin's decision (status[, montant, commentaire]) and release the lease"""
+        try:
+            data = request.get_json(silent=True) or {}
+            valid_statuses = [s.name for s in TransactionStatus]
+            if data.get('status') not in valid_statuses:
+                return jsonify({'error': f'Invalid status. Must be one of: {valid_statuses}'}), 400
+
+            transaction, error = TransactionController._claimed_transaction(transaction_id, data)
+            if error:
+                return error
+
+            if 'montant' in data:
+                transaction.montant = float(data['montant'])
+            if 'commentaire' in data:
+                transaction.commentaire = data['commentaire']
+            transaction.status = data['status']
+            transaction.claimed_by = None
+            transaction.claim_expires_at = None
+
+            # Keep linked referral rows in step, as update_parrainage does
+            for parrainage in Parrainage.query.filter_by(idTransaction=transaction.id).all():
+                parrainage.statut = data['status']
+                if 'montant' in data:
+                    parrainage.montant = float(data['montant'])
+
+            db.session.commit()
+            if transaction.action == 'recharge':
+                BalanceController.schedule_referral_settlement()
+            return jsonify({'message': 'Decision recorded', 'transaction_id': transaction_id, 'version': transaction.version}), 200
+
+        except StaleDataError:
+            db.session.rollback()
+            return jsonify({'error': 'Transaction was modified by someone else'}), 409
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 500
+
+    @staticmethod
+    @admin_required
+    def release_review_item(transaction_id):
+        """Give a claimed transaction back to the queue without deciding it"""
+        try:
+            data = request.get_json(silent=True) or {}
+            transaction, error = TransactionController._claimed_transaction(transaction_id, data)
+            if error:
+                return error
+
+            transaction.claimed_by = None
+            transaction.claim_expires_at = None
+            db.session.commit()
+            return jsonify({'message': 'Claim released', 'transaction_id': transaction_id, 'version': transaction.version}), 200
+
+        except StaleDataError:
+            db.session.rollback()
+            return jsonify({'error': 'Transaction was modified by someone else'}), 409
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
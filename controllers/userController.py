@@ -1,8 +1,11 @@
 from flask import jsonify, request
-from models import User, Qualification, UtilisateurQualification, Parametre, ConfigRetrait, Transaction, TransactionStatus
+from models import User, Qualification, UtilisateurQualification, Parametre, ConfigRetrait, Transaction, UserBalance, \
+    balance_totals_query, referral_downline_ids
 from extension import db
 from sqlalchemy import func
 from util.auth_utils import admin_required
+from util.passwords import password_pool, PasswordPoolBusy, busy_response
+from util.tokens import revoke_subject, current_family
 
 
 class UserController:
@@ -52,6 +55,9 @@ class UserController:
                 devise='DOLLAR'
             )
             db.session.add(user_parametre)
+
+            # Empty balance ledger, updated by the Transaction listeners from now on
+            db.session.add(UserBalance(user_id=new_user.id))
             db.session.commit()
 
             return jsonify({
@@ -70,61 +76,105 @@ class UserController:
                 }
             }), 201
 
+        except PasswordPoolBusy:
+            db.session.rollback()
+            return busy_response()
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
 
     @staticmethod
     def get_balance(user_id):
-        recharges = db.session.query(func.sum(Transaction.montant)).filter(
-            Transaction.user_id == user_id,
-            Transaction.action == 'recharge',
-            Transaction.status == TransactionStatus.COMPLETED
-        ).scalar() or 0
-        retraits = db.session.query(func.sum(Transaction.montant)).filter(
-            Transaction.user_id == user_id,
-            Transaction.action == 'retrait',
-            Transaction.status != TransactionStatus.FAILED
-        ).scalar() or 0
-        gains = db.session.query(func.sum(Transaction.montant)).filter(
-            Transaction.user_id == user_id,
-            Transaction.action == 'gain',
-            Transaction.status == TransactionStatus.COMPLETED
-        ).scalar() or 0
-        return  float(recharges) + float(gains) - float(retraits)
+        """Current balance, read from the user_balances ledger"""
+        ledger = db.session.get(UserBalance, user_id, populate_existing=True)
+        if ledger:
+            return ledger.balance
+
+        # No ledger row yet (user never rebuilt since the ledger was introduced)
+        totals = db.session.execute(
+            balance_totals_query().where(Transaction.user_id == user_id)
+        ).first()
+        if not totals:
+            return 0.0
+        return float(totals.recharges) + float(totals.gains) - float(totals.retraits)
 
     @staticmethod
     @admin_required
     def get_all_users():
-        """Get all users"""
+        """Get all users with config_retrait and balance (optional ?page, ?per_page, ?sort, ?order)"""
         try:
-            users = User.query.all()
-            users_list = []
-
-            for user in users:
-                # config_retrait: null si absent
-                config_retrait = None
-                config = ConfigRetrait.query.filter_by(userId=user.id).first()
-                if config:
-                    config_retrait = {
-                        'depositAdress': config.depositAdress,
-                        'coin': config.coin,
-                        'reseau': config.reseau
-                    }
-
-                balance = UserController.get_balance(user.id)
+            balance = (
+                func.coalesce(UserBalance.recharges, 0)
+                + func.coalesce(UserBalance.gains, 0)
+                - func.coalesce(UserBalance.retraits, 0)
+            ).label('balance')
+
+            sortable = {
+                'balance': balance,
+                'created_at': User.created_at,
+                'nom': User.nom,
+                'email': User.email
+            }
+            sort = request.args.get('sort', 'created_at')
+            if sort not in sortable:
+                return jsonify({'error': f'Invalid sort. Must be one of: {list(sortable)}'}), 400
+            order = request.args.get('order', 'asc')
+            if order not in ['asc', 'desc']:
+                return jsonify({'error': 'Invalid order. Must be asc or desc'}), 400
+            sort_column = sortable[sort]
+            sort_column = sort_column.desc() if order == 'desc' else sort_column.asc()
+
+            # One statement for users + ledger + withdrawal config instead of 4 queries per user
+            query = db.session.query(
+                User.id,
+                User.nom,
+                User.email,
+                User.code_parrainage,
+                User.created_at,
+                ConfigRetrait.depositAdress,
+                ConfigRetrait.coin,
+                ConfigRetrait.reseau,
+                balance
+            ).outerjoin(
+                UserBalance, UserBalance.user_id == User.id
+            ).outerjoin(
+                ConfigRetrait, ConfigRetrait.userId == User.id
+            ).order_by(sort_column, User.id)
+
+            pagination = None
+            if 'page' in request.args or 'per_page' in request.args:
+                page = request.args.get('page', 1, type=int)
+                per_page = min(request.args.get('per_page', 50, type=int), 500)
+                if page < 1 or per_page < 1:
+                    return jsonify({'error': 'page and per_page must be positive integers'}), 400
+                query = query.offset((page - 1) * per_page).limit(per_page)
+                pagination = {
+                    'page': page,
+                    'per_page': per_page,
+                    'total': db.session.query(func.count(User.id)).scalar()
+                }
 
+            users_list = []
+            for row in query.all():
                 users_list.append({
-                    'id': user.id,
-                    'nom': user.nom,
-                    'email': user.email,
-                    'code_parrainage': user.code_parrainage,
-                    'created_at': user.created_at.isoformat(),
-                    'config_retrait': config_retrait,  # null si pas de ConfigRetrait
-                    'balance': balance  # 0.0 si pas de transactions
+                    'id': row.id,
+                    'nom': row.nom,
+                    'email': row.email,
+                    'code_parrainage': row.code_parrainage,
+                    'created_at': row.created_at.isoformat(),
+                    # null si pas de ConfigRetrait
+                    'config_retrait': {
+                        'depositAdress': row.depositAdress,
+                        'coin': row.coin,
+                        'reseau': row.reseau
+                    } if row.depositAdress is not None else None,
+                    'balance': float(row.balance)  # 0.0 si pas de transactions
                 })
 
-            return jsonify({'users': users_list}), 200
+            response = {'users': users_list}
+            if pagination:
+                response['pagination'] = pagination
+            return jsonify(response), 200
         except Exception as e:
             return jsonify({'error': str(e)}), 500
 
@@ -173,10 +223,12 @@ class UserController:
                 user.email = data['email']
 
             if 'mot_de_passe' in data:
-                from app import bcrypt
-                user.mot_de_passe = bcrypt.generate_password_hash(data['mot_de_passe']).decode('utf-8')
+                user.mot_de_passe = password_pool.hash(data['mot_de_passe'])
+                revoke_subject('user', user.id, keep_family=current_family('user', user.id))
 
             if 'code_parrainage' in data:
+                if data['code_parrainage'] and data['code_parrainage'] in referral_downline_ids(db.session.connection(), user.id):
+                    return jsonify({'error': 'A user cannot be referred by someone in their own downline'}), 400
                 user.code_parrainage = data['code_parrainage']
 
             db.session.commit()
@@ -192,6 +244,9 @@ class UserController:
                 }
             }), 200
 
+        except PasswordPoolBusy:
+            db.session.rollback()
+            return busy_response()
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
@@ -232,18 +287,22 @@ class UserController:
                 return jsonify({'error': 'User not found'}), 404
 
             # Verify current password
-            if not user.check_password(data['precedent_mdp']):
+            valid, _ = password_pool.verify(data['precedent_mdp'], user.mot_de_passe)
+            if not valid:
                 return jsonify({'error': 'Incorrect current password'}), 401
 
-            # Update password
-            from app import bcrypt
-            user.mot_de_passe = bcrypt.generate_password_hash(data['nouveau_mdp']).decode('utf-8')
+            # Update password and sign out every other session (the caller's own one stays valid)
+            user.mot_de_passe = password_pool.hash(data['nouveau_mdp'])
+            revoke_subject('user', user.id, keep_family=current_family('user', user.id))
             db.session.commit()
 
             return jsonify({
                 'message': 'Password changed successfully'
             }), 200
 
+        except PasswordPoolBusy:
+            db.session.rollback()
+            return busy_response()
         except Exception as e:
             db.session.rollback()
             return jsonify({'error': str(e)}), 500
@@ -294,6 +353,6 @@ class UserController:
         if not user:
             return False
 
-        if not user.check_password(mdp):
-            return False
-        return True
\ No newline at end of file
+        # Raises PasswordPoolBusy when saturated, answered with a 503 by the app error handler
+        valid, _ = password_pool.verify(mdp, user.mot_de_passe)
+        return valid
\ No newline at end of file
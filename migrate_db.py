@@ -1,6 +1,11 @@
 from app import app, db
 from sqlalchemy import text, inspect
 import pymysql
+import sys
+from models import UserBalance, rebuild_user_balances, Commande, CommandeProduit, sync_commande_produits, \
+    Transaction, Boost, Parrainage, FinanceDailyRollup, rebuild_finance_rollup, Produit, repair_produit_boost_counts, \
+    PayoutBatch, create_referral_gains, settle_referral_gains, ReferralClosure, rebuild_referral_closure, \
+    RefreshToken
 
 def create_database_if_not_exists():
     """Crée la DB si elle n'existe pas (comme init_db.py)"""
@@ -48,9 +53,359 @@ def migrate_boost_transaction_id():
         else:
             print("Colonne 'transaction_id' existe déjà.")
 
+def migrate_user_balances():
+    """Crée la table 'user_balances' et la remplit depuis 'transactions' si elle n'existe pas"""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        if 'user_balances' not in inspector.get_table_names():
+            print("Table 'user_balances' manquante. Création en cours...")
+            UserBalance.__table__.create(bind=db.engine)
+            with db.engine.begin() as conn:
+                rebuild_user_balances(conn)
+            print("Table 'user_balances' créée et remplie avec succès!")
+        else:
+            print("Table 'user_balances' existe déjà.")
+
+def migrate_stat_produit_boost_unique():
+    """Ajoute la contrainte unique (idBoost, idProduit) sur 'stat_produit_boost' si elle n'existe pas"""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        constraints = [c['name'] for c in inspector.get_unique_constraints('stat_produit_boost')]
+
+        if 'uq_stat_boost_produit' not in constraints:
+            print("Contrainte 'uq_stat_boost_produit' manquante. Ajout en cours...")
+            try:
+                with db.engine.connect() as conn:
+                    conn.execute(text(
+                        "ALTER TABLE stat_produit_boost "
+                        "ADD CONSTRAINT uq_stat_boost_produit UNIQUE (idBoost, idProduit)"
+                    ))
+                    conn.commit()
+                print("Contrainte 'uq_stat_boost_produit' ajoutée avec succès!")
+            except Exception as e:
+                print(f"Impossible d'ajouter la contrainte (doublons existants ?): {e}")
+        else:
+            print("Contrainte 'uq_stat_boost_produit' existe déjà.")
+
+def migrate_commande_produits(batch_size=500):
+    """Crée la table 'commande_produits' et la remplit depuis 'commandes.tableauProduit' par lots"""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        if 'commande_produits' in inspector.get_table_names():
+            print("Table 'commande_produits' existe déjà.")
+            return
+
+        print("Table 'commande_produits' manquante. Création en cours...")
+        CommandeProduit.__table__.create(bind=db.engine)
+
+        last_id = ''
+        total = 0
+        while True:
+            with db.engine.begin() as conn:
+                batch = conn.execute(
+                    db.select(Commande.idCommande, Commande.tableauProduit)
+                    .where(Commande.idCommande > last_id)
+                    .order_by(Commande.idCommande)
+                    .limit(batch_size)
+                ).all()
+                if not batch:
+                    break
+                sync_commande_produits(conn, {row.idCommande: row.tableauProduit for row in batch})
+            last_id = batch[-1].idCommande
+            total += len(batch)
+            print(f"  {total} commandes traitées...")
+        print("Table 'commande_produits' créée et remplie avec succès!")
+
+# Index secondaires déclarés dans models.py (__table_args__)
+INDEXED_MODELS = [Transaction, Boost, Parrainage, Produit]
+
+# Requêtes chaudes dont on compare le plan avant/après (valeurs d'exemple)
+HOT_QUERIES = [
+    ("solde utilisateur",
+     "SELECT SUM(montant) FROM transactions WHERE user_id = :user_id AND action = 'recharge' AND status = 'COMPLETED'"),
+    ("dashboard par statut",
+     "SELECT id FROM transactions WHERE status = 'PENDING' ORDER BY date_transaction DESC LIMIT 50"),
+    ("dashboard par action",
+     "SELECT id FROM transactions WHERE action IN ('recharge', 'retrait') AND date_transaction >= :since"),
+    ("boosts par statut",
+     "SELECT idBoost FROM boosts WHERE statut IN ('A_VALIDE', 'EN_COURS') ORDER BY date DESC"),
+    ("boosts d'un utilisateur",
+     "SELECT idBoost FROM boosts WHERE idUtilisateur = :user_id"),
+    ("top produits",
+     "SELECT idProduit FROM produits ORDER BY boost_count DESC LIMIT 5"),
+    ("transactions hors boosts",
+     "SELECT t.id FROM transactions t LEFT JOIN boosts b ON b.transaction_id = t.id "
+     "WHERE t.action IN ('recharge', 'retrait') AND b.idBoost IS NULL"),
+    ("parrainages d'un utilisateur",
+     "SELECT idParainnage FROM parrainages WHERE idOldUser = :user_id ORDER BY date DESC"),
+]
+
+def explain_hot_queries(conn):
+    """Affiche le plan d'exécution des requêtes chaudes"""
+    from datetime import datetime
+    params = {
+        'user_id': conn.execute(text("SELECT id FROM users LIMIT 1")).scalar() or '',
+        'since': datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    }
+    prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    for label, sql in HOT_QUERIES:
+        print(f"  -- {label}")
+        for row in conn.execute(text(prefix + sql), params):
+            print(f"     {tuple(row)}")
+
+def migrate_indexes(explain=True):
+    """Ajoute les index composites manquants sans verrouiller les tables (InnoDB online DDL)"""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        with db.engine.connect() as conn:
+            if explain:
+                print("Plans AVANT:")
+                explain_hot_queries(conn)
+
+            for model in INDEXED_MODELS:
+                table = model.__table__
+                existing = {index['name'] for index in inspector.get_indexes(table.name)}
+                for index in table.indexes:
+                    if index.name in existing:
+                        print(f"Index '{index.name}' existe déjà.")
+                        continue
+                    columns = ', '.join(column.name for column in index.columns)
+                    print(f"Index '{index.name}' manquant. Ajout en cours...")
+                    if conn.dialect.name == 'mysql':
+                        # INPLACE + LOCK=NONE: lectures et écritures continuent pendant la construction
+                        conn.execute(text(
+                            f"ALTER TABLE {table.name} ADD INDEX {index.name} ({columns}), "
+                            f"ALGORITHM=INPLACE, LOCK=NONE"
+                        ))
+                    else:
+                        conn.execute(text(f"CREATE INDEX {index.name} ON {table.name} ({columns})"))
+                    conn.commit()
+                    print(f"Index '{index.name}' ajouté avec succès!")
+
+            if explain:
+                print("Plans APRÈS:")
+                explain_hot_queries(conn)
+
+def migrate_finance_rollup():
+    """Crée la table 'finance_daily_rollup' et la remplit depuis 'transactions' si elle n'existe pas"""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        if 'finance_daily_rollup' not in inspector.get_table_names():
+            print("Table 'finance_daily_rollup' manquante. Création en cours...")
+            FinanceDailyRollup.__table__.create(bind=db.engine)
+            with db.engine.begin() as conn:
+                rebuild_finance_rollup(conn)
+            print("Table 'finance_daily_rollup' créée et remplie avec succès!")
+        else:
+            print("Table 'finance_daily_rollup' existe déjà.")
+
+def rebuild_rollup():
+    """Recalcule 'finance_daily_rollup' depuis 'transactions'"""
+    with app.app_context():
+        with db.engine.begin() as conn:
+            rebuild_finance_rollup(conn)
+        print("Rollup financier recalculé depuis 'transactions'.")
+
+def migrate_produit_boost_count():
+    """Ajoute la colonne 'boost_count' à la table 'produits' et la remplit si elle n'existe pas"""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [col['name'] for col in inspector.get_columns('produits')]
+
+        if 'boost_count' not in columns:
+            print("Colonne 'boost_count' manquante. Ajout en cours...")
+            with db.engine.connect() as conn:
+                conn.execute(text("ALTER TABLE produits ADD COLUMN boost_count INTEGER NOT NULL DEFAULT 0"))
+                conn.commit()
+            repair_boost_counts()
+            print("Colonne 'boost_count' ajoutée avec succès!")
+        else:
+            print("Colonne 'boost_count' existe déjà.")
+
+def migrate_transaction_review_queue():
+    """Ajoute les colonnes de la file de validation ('version', 'claimed_by', 'claim_expires_at') à 'transactions'"""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [col['name'] for col in inspector.get_columns('transactions')]
+        missing = [
+            (name, ddl) for name, ddl in (
+                ('version', "INTEGER NOT NULL DEFAULT 1"),
+                ('claimed_by', "VARCHAR(12) NULL"),
+                ('claim_expires_at', "DATETIME NULL"),
+            ) if name not in columns
+        ]
+
+        if not missing:
+            print("Colonnes de la file de validation existent déjà.")
+            return
+        with db.engine.connect() as conn:
+            for name, ddl in missing:
+                print(f"Colonne '{name}' manquante. Ajout en cours...")
+                conn.execute(text(f"ALTER TABLE transactions ADD COLUMN {name} {ddl}"))
+            conn.commit()
+        print("Colonnes de la file de validation ajoutées avec succès!")
+
+def migrate_payout_batches():
+    """Crée la table 'payout_batches' et ajoute 'transactions.payout_batch_id' s'ils n'existent pas"""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        if 'payout_batches' not in inspector.get_table_names():
+            print("Table 'payout_batches' manquante. Création en cours...")
+            PayoutBatch.__table__.create(bind=db.engine)
+            print("Table 'payout_batches' créée avec succès!")
+        else:
+            print("Table 'payout_batches' existe déjà.")
+
+        columns = [col['name'] for col in inspector.get_columns('transactions')]
+        if 'payout_batch_id' not in columns:
+            print("Colonne 'payout_batch_id' manquante. Ajout en cours...")
+            with db.engine.connect() as conn:
+                conn.execute(text("ALTER TABLE transactions ADD COLUMN payout_batch_id VARCHAR(12) NULL"))
+                if conn.dialect.name == 'mysql':
+                    conn.execute(text(
+                        "ALTER TABLE transactions ADD CONSTRAINT fk_transactions_payout_batch "
+                        "FOREIGN KEY (payout_batch_id) REFERENCES payout_batches (idBatch)"
+                    ))
+                conn.commit()
+            print("Colonne 'payout_batch_id' ajoutée avec succès!")
+        else:
+            print("Colonne 'payout_batch_id' existe déjà.")
+
+def migrate_parrainage_source(batch_size=500):
+    """Ajoute 'parrainages.idSourceTransaction' et y relie les gains existants à leur recharge"""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [col['name'] for col in inspector.get_columns('parrainages')]
+        if 'idSourceTransaction' in columns:
+            print("Colonne 'idSourceTransaction' existe déjà.")
+            return
+
+        print("Colonne 'idSourceTransaction' manquante. Ajout en cours...")
+        with db.engine.connect() as conn:
+            conn.execute(text("ALTER TABLE parrainages ADD COLUMN idSourceTransaction VARCHAR(12) NULL"))
+            conn.execute(text("CREATE UNIQUE INDEX uq_parrainages_source ON parrainages (idSourceTransaction)"))
+            if conn.dialect.name == 'mysql':
+                conn.execute(text(
+                    "ALTER TABLE parrainages ADD CONSTRAINT fk_parrainages_source "
+                    "FOREIGN KEY (idSourceTransaction) REFERENCES transactions (id)"
+                ))
+            conn.commit()
+
+        # Les anciens gains étaient créés juste après la recharge du filleul:
+        # on relie chacun à la recharge la plus récente qui le précède et n'est pas déjà reliée
+        with db.engine.begin() as conn:
+            parrainages = conn.execute(text(
+                "SELECT idParainnage, idNewUser, date FROM parrainages ORDER BY idNewUser, date"
+            )).all()
+            recharges = {}
+            for row in conn.execute(text(
+                "SELECT id, user_id, date_transaction FROM transactions "
+                "WHERE action = 'recharge' ORDER BY user_id, date_transaction"
+            )):
+                recharges.setdefault(row.user_id, []).append(row)
+
+            links = []
+            for parrainage in parrainages:
+                candidates = recharges.get(parrainage.idNewUser, [])
+                match = None
+                for recharge in candidates:
+                    if recharge.date_transaction and parrainage.date and recharge.date_transaction > parrainage.date:
+                        break
+                    match = recharge
+                if match:
+                    candidates.remove(match)
+                    links.append({'source': match.id, 'id': parrainage.idParainnage})
+
+            for start in range(0, len(links), batch_size):
+                conn.execute(text(
+                    "UPDATE parrainages SET idSourceTransaction = :source WHERE idParainnage = :id"
+                ), links[start:start + batch_size])
+        print(f"Colonne 'idSourceTransaction' ajoutée, {len(links)}/{len(parrainages)} gains reliés à leur recharge.")
+
+def settle_referrals():
+    """Crée les gains de parrainage manquants et règle ceux dont la recharge est décidée"""
+    with app.app_context():
+        with db.engine.begin() as conn:
+            created = create_referral_gains(conn)
+            settled = settle_referral_gains(conn)
+        print(f"Gains de parrainage: {created} créés, {settled['COMPLETED']} complétés, {settled['FAILED']} échoués.")
+
+def migrate_referral_closure():
+    """Crée la table 'referral_closure' et la remplit depuis 'users.code_parrainage' si elle n'existe pas"""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        if 'referral_closure' not in inspector.get_table_names():
+            print("Table 'referral_closure' manquante. Création en cours...")
+            ReferralClosure.__table__.create(bind=db.engine)
+            rebuild_referral_tree()
+            print("Table 'referral_closure' créée et remplie avec succès!")
+        else:
+            print("Table 'referral_closure' existe déjà.")
+
+def rebuild_referral_tree():
+    """Recalcule 'referral_closure' depuis 'users.code_parrainage'"""
+    with app.app_context():
+        with db.engine.begin() as conn:
+            rebuild_referral_closure(conn)
+        print("Arbre de parrainage recalculé depuis 'users'.")
+
+def migrate_refresh_tokens():
+    """Crée la table 'refresh_tokens' si elle n'existe pas"""
+    with app.app_context():
+        inspector = inspect(db.engine)
+        if 'refresh_tokens' not in inspector.get_table_names():
+            print("Table 'refresh_tokens' manquante. Création en cours...")
+            RefreshToken.__table__.create(bind=db.engine)
+            print("Table 'refresh_tokens' créée avec succès!")
+        else:
+            print("Table 'refresh_tokens' existe déjà.")
+
+def repair_boost_counts():
+    """Recalcule 'produits.boost_count' depuis 'stat_produit_boost'"""
+    with app.app_context():
+        with db.engine.begin() as conn:
+            repair_produit_boost_counts(conn)
+        print("boost_count recalculé depuis 'stat_produit_boost'.")
+
+def rebuild_balances():
+    """Recalcule tous les soldes de 'user_balances' depuis 'transactions'"""
+    with app.app_context():
+        with db.engine.begin() as conn:
+            rebuild_user_balances(conn)
+        print("Soldes recalculés depuis 'transactions'.")
+
+# Commandes ponctuelles: python migrate_db.py <commande>
+COMMANDS = {
+    'rebuild-balances': rebuild_balances,
+    'add-indexes': migrate_indexes,
+    'rebuild-finance-rollup': rebuild_rollup,
+    'repair-boost-counts': repair_boost_counts,
+    'settle-referrals': settle_referrals,
+    'rebuild-referral-tree': rebuild_referral_tree,
+}
+
 if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        command = COMMANDS.get(sys.argv[1])
+        if not command:
+            print(f"Commande inconnue: {sys.argv[1]} (disponibles: {', '.join(COMMANDS)})")
+            sys.exit(1)
+        command()
+        sys.exit(0)
+
     print("Migration en cours...")
     create_database_if_not_exists()
     migrate_commandes_image()
     migrate_boost_transaction_id()
+    migrate_user_balances()
+    migrate_stat_produit_boost_unique()
+    migrate_commande_produits()
+    migrate_produit_boost_count()
+    migrate_transaction_review_queue()
+    migrate_payout_batches()
+    migrate_parrainage_source()
+    migrate_referral_closure()
+    migrate_refresh_tokens()
+    migrate_indexes(explain=False)
+    migrate_finance_rollup()
     print("Migration terminée!")
@@ -1,8 +1,11 @@
-from extension import db, bcrypt
-from datetime import datetime
+from extension import db
+from datetime import datetime, timedelta
+from decimal import Decimal
 import enum
-from utils import generate_id
-from sqlalchemy import event
+from utils import generate_id, generate_ids
+from util.passwords import password_pool
+from sqlalchemy import event, select, func, case, and_, or_, inspect, true
+from sqlalchemy.dialects import mysql, sqlite
 
 
 class QualificationValue(enum.Enum):
@@ -30,11 +33,11 @@ class User(db.Model):
     def __init__(self, nom, email, mot_de_passe, code_parrainage=None):
         self.nom = nom
         self.email = email
-        self.mot_de_passe = bcrypt.generate_password_hash(mot_de_passe).decode('utf-8')
+        self.mot_de_passe = password_pool.hash(mot_de_passe)
         self.code_parrainage = code_parrainage
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.mot_de_passe, password)
+        return password_pool.verify(password, self.mot_de_passe)[0]
 
     def __repr__(self):
         return f'<User {self.nom}>'
@@ -50,10 +53,10 @@ class Admin(db.Model):
 
     def __init__(self, email, mot_de_passe):
         self.email = email
-        self.mot_de_passe = bcrypt.generate_password_hash(mot_de_passe).decode('utf-8')
+        self.mot_de_passe = password_pool.hash(mot_de_passe)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.mot_de_passe, password)
+        return password_pool.verify(password, self.mot_de_passe)[0]
 
     def __repr__(self):
         return f'<Admin {self.email}>'
@@ -119,6 +122,12 @@ class TransactionStatus(enum.Enum):
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        db.Index('ix_transactions_user_action_status', 'user_id', 'action', 'status'),
+        db.Index('ix_transactions_status_date', 'status', 'date_transaction'),
+        db.Index('ix_transactions_action_date', 'action', 'date_transaction'),
+        db.Index('ix_transactions_payout_batch', 'payout_batch_id'),
+    )
 
     id = db.Column(db.String(12), primary_key=True)
     user_id = db.Column(db.String(12), db.ForeignKey('users.id'), nullable=False)
@@ -131,12 +140,88 @@ class Transaction(db.Model):
     recipient_address = db.Column(db.String(255), nullable=True)
     transaction_hash = db.Column(db.String(100), nullable=True)
     image_filename = db.Column(db.String(255), nullable=True)
+    # Review queue: bumped on every write so stale edits are rejected, lease held by one admin
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    claimed_by = db.Column(db.String(12), nullable=True)  # admins.id
+    claim_expires_at = db.Column(db.DateTime, nullable=True)
+    # Withdrawals handed to a payout run; recipient_address is snapshotted from config_retraits at that point
+    payout_batch_id = db.Column(db.String(12), db.ForeignKey('payout_batches.idBatch'), nullable=True)
 
     user = db.relationship('User', backref='transactions')
 
+    __mapper_args__ = {'version_id_col': version}
+
     def __repr__(self):
         return f'<Transaction {self.action} {self.montant} for user {self.user_id}>'
 
+
+class UserBalance(db.Model):
+    """Running totals per user, kept in sync with `transactions` by the listeners below"""
+    __tablename__ = 'user_balances'
+
+    user_id = db.Column(db.String(12), db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    recharges = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    retraits = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    gains = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    @property
+    def balance(self):
+        return float(self.recharges) + float(self.gains) - float(self.retraits)
+
+    def __repr__(self):
+        return f'<UserBalance user={self.user_id} balance={self.balance}>'
+
+class ReferralClosure(db.Model):
+    """Every (ancestor, descendant) pair of the referral tree with its distance, kept in sync by the listeners below"""
+    __tablename__ = 'referral_closure'
+    __table_args__ = (
+        db.Index('ix_referral_closure_ancestor_depth', 'ancestor_id', 'depth'),
+        db.Index('ix_referral_closure_descendant', 'descendant_id'),
+    )
+
+    ancestor_id = db.Column(db.String(12), db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    descendant_id = db.Column(db.String(12), db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    depth = db.Column(db.Integer, nullable=False)  # 0 for the user itself, 1 for direct referrals
+
+    def __repr__(self):
+        return f'<ReferralClosure {self.ancestor_id} -> {self.descendant_id} ({self.depth})>'
+
+class RefreshToken(db.Model):
+    """Refresh token of a login session, stored as a SHA-256 hash and rotated on every use"""
+    __tablename__ = 'refresh_tokens'
+    __table_args__ = (
+        db.Index('ix_refresh_tokens_family', 'family_id'),
+        db.Index('ix_refresh_tokens_subject', 'subject_kind', 'subject_id'),
+        db.Index('ix_refresh_tokens_revoked', 'revoked_at'),
+    )
+
+    id = db.Column(db.String(12), primary_key=True)
+    token_hash = db.Column(db.String(64), nullable=False, unique=True)
+    family_id = db.Column(db.String(32), nullable=False)  # one per login, carried as 'sid' in access tokens
+    subject_kind = db.Column(db.String(10), nullable=False)  # user, admin
+    subject_id = db.Column(db.String(12), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    replaced_by = db.Column(db.String(12), nullable=True)  # set once rotated; presenting it again revokes the family
+    revoked_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<RefreshToken {self.id} {self.subject_kind} {self.subject_id}>'
+
+class FinanceDailyRollup(db.Model):
+    """Transaction count and amount per day x action x status, maintained by the listeners below"""
+    __tablename__ = 'finance_daily_rollup'
+
+    day = db.Column(db.Date, primary_key=True)
+    action = db.Column(db.String(20), primary_key=True)
+    status = db.Column(db.Enum(TransactionStatus), primary_key=True)
+    tx_count = db.Column(db.Integer, nullable=False, default=0)
+    montant = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<FinanceDailyRollup {self.day} {self.action} {self.status} {self.tx_count} {self.montant}>'
+
 class Revendeur(db.Model):
     __tablename__ = 'revendeurs'
 
@@ -159,6 +244,8 @@ class Produit(db.Model):
     revendeur_id = db.Column(db.String(12), db.ForeignKey('revendeurs.id'), nullable=False)
     description_produit = db.Column(db.Text, nullable=True)
     linkProduit = db.Column(db.String(500))
+    # Number of StatProduitBoost rows for this product, maintained by the listeners below
+    boost_count = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
     revendeur = db.relationship('Revendeur', back_populates='produits')
     stats = db.relationship('StatProduitBoost', back_populates='produit')
 
@@ -199,12 +286,33 @@ class Commande(db.Model):
     statut = db.Column(db.Enum(CommandeStatut))
     image = db.Column(db.String(255), nullable=True)
 
+    # Normalized copy of tableauProduit, rewritten by the listeners below
+    produits = db.relationship('CommandeProduit', order_by='CommandeProduit.position', viewonly=True)
+
     def __repr__(self):
         return f'<Commande {self.idCommande}>'
 
 
+class CommandeProduit(db.Model):
+    __tablename__ = 'commande_produits'
+
+    idCommande = db.Column(db.String(12), db.ForeignKey('commandes.idCommande', ondelete='CASCADE'), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)
+    idProduit = db.Column(db.String(12), db.ForeignKey('produits.idProduit', ondelete='CASCADE'), nullable=False, index=True)
+
+    produit = db.relationship('Produit')
+
+    def __repr__(self):
+        return f'<CommandeProduit {self.idCommande}#{self.position} {self.idProduit}>'
+
+
 class Boost(db.Model):
     __tablename__ = 'boosts'
+    __table_args__ = (
+        db.Index('ix_boosts_statut_date', 'statut', 'date'),
+        db.Index('ix_boosts_utilisateur_date', 'idUtilisateur', 'date'),
+        db.Index('ix_boosts_transaction', 'transaction_id'),
+    )
 
     idBoost = db.Column(db.String(12), primary_key=True)
     idCommande = db.Column(db.String(12), db.ForeignKey('commandes.idCommande'), nullable=False)
@@ -222,6 +330,9 @@ class Boost(db.Model):
 
 class StatProduitBoost(db.Model):
     __tablename__ = 'stat_produit_boost'
+    __table_args__ = (
+        db.UniqueConstraint('idBoost', 'idProduit', name='uq_stat_boost_produit'),
+    )
 
     idStatProduitBoost = db.Column(db.String(12), primary_key=True)
     idBoost = db.Column(db.String(12), db.ForeignKey('boosts.idBoost'), nullable=False)
@@ -267,6 +378,24 @@ class ConfigRetrait(db.Model):
         return f'<ConfigRetrait {self.id} for user {self.userId}>'
 
 
+class PayoutBatch(db.Model):
+    """One payout run for the pending withdrawals sharing a coin and network"""
+    __tablename__ = 'payout_batches'
+
+    idBatch = db.Column(db.String(12), primary_key=True)
+    coin = db.Column(db.String(50), nullable=False)
+    reseau = db.Column(db.String(100), nullable=False)
+    nbTransactions = db.Column(db.Integer, nullable=False, default=0)
+    montantTotal = db.Column(db.Numeric(16, 2), nullable=False, default=0)
+    createdBy = db.Column(db.String(12), nullable=True)  # admins.id
+    date = db.Column(db.DateTime, default=datetime.utcnow)
+
+    transactions = db.relationship('Transaction', backref='payout_batch', lazy='dynamic')
+
+    def __repr__(self):
+        return f'<PayoutBatch {self.idBatch} {self.coin}/{self.reseau} ({self.nbTransactions})>'
+
+
 class MinRetrait(db.Model):
     __tablename__ = 'min_retraits'
 
@@ -279,9 +408,15 @@ class MinRetrait(db.Model):
 
 class Parrainage(db.Model):
     __tablename__ = 'parrainages'
+    __table_args__ = (
+        db.Index('ix_parrainages_old_user_date', 'idOldUser', 'date'),
+        db.UniqueConstraint('idSourceTransaction', name='uq_parrainages_source'),
+    )
 
     idParainnage = db.Column(db.String(12), primary_key=True)
     idTransaction = db.Column(db.String(12), db.ForeignKey('transactions.id'), nullable=False)
+    # Recharge that earned this gain; unique so the settlement job never creates it twice
+    idSourceTransaction = db.Column(db.String(12), db.ForeignKey('transactions.id'), nullable=True)
     idNewUser = db.Column(db.String(12), db.ForeignKey('users.id'), nullable=False)
     idOldUser = db.Column(db.String(12), db.ForeignKey('users.id'), nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
@@ -289,7 +424,7 @@ class Parrainage(db.Model):
     montant = db.Column(db.Numeric(10, 2), nullable=False)
 
     # Relationships
-    transaction = db.relationship('Transaction', backref='parrainages')
+    transaction = db.relationship('Transaction', backref='parrainages', foreign_keys=[idTransaction])
     new_user = db.relationship('User', foreign_keys=[idNewUser])
     old_user = db.relationship('User', foreign_keys=[idOldUser])
 
@@ -365,36 +500,594 @@ def set_transaction_id(mapper, connect, target):
     if not target.id:
         target.id = generate_id()
 
+@event.listens_for(RefreshToken, 'before_insert')
+def set_refresh_token_id(mapper, connect, target):
+    if not target.id:
+        target.id = generate_id()
+
+@event.listens_for(PayoutBatch, 'before_insert')
+def set_payout_batch_id(mapper, connect, target):
+    if not target.idBatch:
+        target.idBatch = generate_id()
+
 @event.listens_for(MinRetrait, 'before_insert')
 def set_min_retrait_id(mapper, connect, target):
     if not target.id:
         target.id = generate_id()
 
+# Keep commande_produits in step with Commande.tableauProduit
+def sync_commande_produits(connection, tableaux):
+    """Rewrite commande_produits for {idCommande: tableauProduit}, skipping unknown product ids"""
+    if not tableaux:
+        return
+    table = CommandeProduit.__table__
+    connection.execute(table.delete().where(table.c.idCommande.in_(list(tableaux))))
+
+    wanted = {idProduit for tableau in tableaux.values() for idProduit in (tableau or []) if idProduit}
+    if not wanted:
+        return
+    existing = set(connection.execute(
+        select(Produit.idProduit).where(Produit.idProduit.in_(wanted))
+    ).scalars())
+
+    rows = []
+    for idCommande, tableau in tableaux.items():
+        position = 0
+        for idProduit in tableau or []:
+            if idProduit in existing:
+                rows.append({'idCommande': idCommande, 'position': position, 'idProduit': idProduit})
+                position += 1
+    if rows:
+        connection.execute(table.insert(), rows)
+
+
+@event.listens_for(Commande, 'after_insert')
+def create_commande_produits(mapper, connection, commande):
+    sync_commande_produits(connection, {commande.idCommande: commande.tableauProduit})
+
+
+@event.listens_for(Commande, 'after_update')
+def update_commande_produits(mapper, connection, commande):
+    if inspect(commande).attrs.tableauProduit.history.has_changes():
+        sync_commande_produits(connection, {commande.idCommande: commande.tableauProduit})
+
+
 # Auto-create StatProduitBoost on Boost insert
 @event.listens_for(Boost, 'after_insert')
 def auto_create_stats(mapper, connection, boost):
-    from sqlalchemy.orm import Session
-
-    # Create a new session for this operation
-    session = Session(bind=connection)
-
+    produit_ids = connection.execute(
+        select(CommandeProduit.idProduit)
+        .where(CommandeProduit.idCommande == boost.idCommande)
+        .order_by(CommandeProduit.position)
+    ).scalars().all()
+
+    # A brand-new boost has no stats yet: one row per distinct product, in commande order
+    produit_ids = list(dict.fromkeys(produit_ids))
+    if not produit_ids:
+        return
+    connection.execute(StatProduitBoost.__table__.insert(), [
+        {
+            'idStatProduitBoost': stat_id,
+            'idBoost': boost.idBoost,
+            'idProduit': idProduit,
+            'cout': 0.00,
+            'commission': 0.00,
+            'statut': StatProduitBoostStatut.A_FAIRE
+        }
+        for stat_id, idProduit in zip(generate_ids(len(produit_ids)), produit_ids)
+    ])
+    _increment_boost_count(connection, produit_ids, 1)
+
+
+# Produit.boost_count: one per StatProduitBoost row
+def _increment_boost_count(connection, produit_ids, step):
+    if not produit_ids:
+        return
+    table = Produit.__table__
+    connection.execute(table.update().where(table.c.idProduit.in_(list(produit_ids))).values(
+        boost_count=table.c.boost_count + step
+    ))
+
+
+def repair_produit_boost_counts(connection):
+    """Recompute every produits.boost_count from stat_produit_boost"""
+    table = Produit.__table__
+    stats = StatProduitBoost.__table__
+    connection.execute(table.update().values(boost_count=(
+        select(func.count(stats.c.idStatProduitBoost))
+        .where(stats.c.idProduit == table.c.idProduit)
+        .scalar_subquery()
+    )))
+
+
+@event.listens_for(StatProduitBoost, 'after_insert')
+def count_stat_on_insert(mapper, connection, stat):
+    _increment_boost_count(connection, [stat.idProduit], 1)
+
+
+@event.listens_for(StatProduitBoost, 'after_delete')
+def count_stat_on_delete(mapper, connection, stat):
+    _increment_boost_count(connection, [stat.idProduit], -1)
+
+
+# Balance ledger: every write to `transactions` is folded into `user_balances`
+def balance_totals_query():
+    """Per-user recharge/retrait/gain totals straight from `transactions`"""
+    return select(
+        Transaction.user_id.label('user_id'),
+        func.coalesce(func.sum(case(
+            (and_(Transaction.action == 'recharge', Transaction.status == TransactionStatus.COMPLETED), Transaction.montant),
+            else_=0
+        )), 0).label('recharges'),
+        func.coalesce(func.sum(case(
+            (and_(Transaction.action == 'retrait', Transaction.status != TransactionStatus.FAILED), Transaction.montant),
+            else_=0
+        )), 0).label('retraits'),
+        func.coalesce(func.sum(case(
+            (and_(Transaction.action == 'gain', Transaction.status == TransactionStatus.COMPLETED), Transaction.montant),
+            else_=0
+        )), 0).label('gains')
+    ).group_by(Transaction.user_id)
+
+
+def rebuild_user_balances(connection, user_ids=None):
+    """Recompute `user_balances` from `transactions` (all users, or only `user_ids`)"""
+    table = UserBalance.__table__
+    totals = balance_totals_query().add_columns(func.now())
+    delete = table.delete()
+    if user_ids is not None:
+        totals = totals.where(Transaction.user_id.in_(user_ids))
+        delete = delete.where(table.c.user_id.in_(user_ids))
+    connection.execute(delete)
+    connection.execute(table.insert().from_select(
+        ['user_id', 'recharges', 'retraits', 'gains', 'updated_at'], totals
+    ))
+
+
+def _as_status(value):
+    if value is None or isinstance(value, TransactionStatus):
+        return value
+    # Controllers assign either the enum name ('COMPLETED') or its value ('completed')
     try:
-        commande = session.query(Commande).filter_by(idCommande=boost.idCommande).first()
-        if commande and commande.tableauProduit:
-            for idProduit in commande.tableauProduit:
-                if idProduit:
-                    existing = session.query(StatProduitBoost).filter_by(
-                        idBoost=boost.idBoost,
-                        idProduit=idProduit
-                    ).first()
-                    if not existing:
-                        stat = StatProduitBoost(
-                            idBoost=boost.idBoost,
-                            idProduit=idProduit,
-                            cout=0.00,
-                            commission=0.00
-                        )
-                        session.add(stat)
-        session.commit()
-    finally:
-        session.close()
+        return TransactionStatus[value]
+    except KeyError:
+        return TransactionStatus(value)
+
+
+def _balance_contribution(action, status, montant):
+    """(recharges, retraits, gains) that a single transaction adds to its user's balance"""
+    zero = Decimal('0')
+    if montant is None:
+        return zero, zero, zero
+    montant = Decimal(str(montant))
+    status = _as_status(status)
+    if action == 'recharge' and status == TransactionStatus.COMPLETED:
+        return montant, zero, zero
+    if action == 'retrait' and status != TransactionStatus.FAILED:
+        return zero, montant, zero
+    if action == 'gain' and status == TransactionStatus.COMPLETED:
+        return zero, zero, montant
+    return zero, zero, zero
+
+
+def _upsert_add(connection, table, values, key_columns, added_columns):
+    """INSERT `values`, or add its `added_columns` to the row that already has the same key, in one statement"""
+    if connection.dialect.name == 'mysql':
+        stmt = mysql.insert(table).values(**values)
+        connection.execute(stmt.on_duplicate_key_update(
+            **{name: table.c[name] + stmt.inserted[name] for name in added_columns},
+            **{name: values[name] for name in values if name not in key_columns and name not in added_columns}
+        ))
+    elif connection.dialect.name == 'sqlite':
+        stmt = sqlite.insert(table).values(**values)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={**{name: table.c[name] + stmt.excluded[name] for name in added_columns},
+                  **{name: values[name] for name in values if name not in key_columns and name not in added_columns}}
+        ))
+    else:
+        result = connection.execute(table.update().where(and_(
+            *[table.c[name] == values[name] for name in key_columns]
+        )).values(
+            **{name: table.c[name] + values[name] for name in added_columns},
+            **{name: values[name] for name in values if name not in key_columns and name not in added_columns}
+        ))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**values))
+
+
+def _apply_balance_delta(connection, user_id, delta):
+    if not any(delta):
+        return
+    # Upsert so two first transactions of a user cannot both try to create the ledger row
+    _upsert_add(connection, UserBalance.__table__, {
+        'user_id': user_id,
+        'recharges': delta[0],
+        'retraits': delta[1],
+        'gains': delta[2],
+        'updated_at': datetime.utcnow()
+    }, ['user_id'], ['recharges', 'retraits', 'gains'])
+
+
+@event.listens_for(Transaction, 'after_insert')
+def track_balance_on_insert(mapper, connection, target):
+    _apply_balance_delta(connection, target.user_id,
+                         _balance_contribution(target.action, target.status, target.montant))
+
+
+# Columns the ledger and the rollup fold in; their pre-update values are needed on every update
+TRACKED_COLUMNS = ('user_id', 'date_transaction', 'action', 'status', 'montant')
+
+
+@event.listens_for(Transaction, 'before_update')
+def load_previous_values(mapper, connection, target):
+    """Read the old value of tracked columns assigned while expired (no history), before the UPDATE overwrites it"""
+    state = inspect(target)
+    missing = [name for name in TRACKED_COLUMNS
+               if state.attrs[name].history.has_changes() and not state.attrs[name].history.deleted]
+    state.info['previous_values'] = {}
+    if not missing:
+        return
+    table = Transaction.__table__
+    row = connection.execute(
+        select(*[table.c[name] for name in missing]).where(table.c.id == target.id)
+    ).one_or_none()
+    if row is not None:
+        state.info['previous_values'] = dict(row._mapping)
+
+
+def _previous_value(target, name):
+    """Value of `name` before the update being flushed"""
+    state = inspect(target)
+    history = state.attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    return state.info.get('previous_values', {}).get(name, getattr(target, name))
+
+
+@event.listens_for(Transaction, 'after_update')
+def track_balance_on_update(mapper, connection, target):
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes() for name in ('user_id', 'action', 'status', 'montant')):
+        return
+
+    old_user_id = _previous_value(target, 'user_id')
+    old = _balance_contribution(_previous_value(target, 'action'),
+                                _previous_value(target, 'status'),
+                                _previous_value(target, 'montant'))
+    new = _balance_contribution(target.action, target.status, target.montant)
+    if old_user_id == target.user_id:
+        _apply_balance_delta(connection, target.user_id, tuple(n - o for n, o in zip(new, old)))
+    else:
+        _apply_balance_delta(connection, old_user_id, tuple(-o for o in old))
+        _apply_balance_delta(connection, target.user_id, new)
+
+
+@event.listens_for(Transaction, 'after_delete')
+def track_balance_on_delete(mapper, connection, target):
+    contribution = _balance_contribution(target.action, target.status, target.montant)
+    _apply_balance_delta(connection, target.user_id, tuple(-c for c in contribution))
+
+
+# Daily finance rollup: same hooks, bucketed by day x action x status
+def rebuild_finance_rollup(connection, days=None):
+    """Recompute `finance_daily_rollup` from `transactions` (all days, or only `days`)"""
+    table = FinanceDailyRollup.__table__
+    day = func.date(Transaction.date_transaction)
+    totals = select(
+        day, Transaction.action, Transaction.status,
+        func.count(Transaction.id), func.coalesce(func.sum(Transaction.montant), 0)
+    ).group_by(day, Transaction.action, Transaction.status)
+    delete = table.delete()
+    if days is not None:
+        days = list(days)
+        if not days:
+            return
+        totals = totals.where(or_(*[
+            and_(Transaction.date_transaction >= datetime.combine(d, datetime.min.time()),
+                 Transaction.date_transaction < datetime.combine(d, datetime.min.time()) + timedelta(days=1))
+            for d in days
+        ]))
+        delete = delete.where(table.c.day.in_(days))
+    connection.execute(delete)
+    connection.execute(table.insert().from_select(['day', 'action', 'status', 'tx_count', 'montant'], totals))
+
+
+def _increment_rollup(connection, date_transaction, action, status, count, montant):
+    if not count and not montant:
+        return
+    _upsert_add(connection, FinanceDailyRollup.__table__, {
+        'day': (date_transaction or datetime.utcnow()).date(),
+        'action': action,
+        'status': _as_status(status),
+        'tx_count': count,
+        'montant': Decimal(str(montant or 0))
+    }, ['day', 'action', 'status'], ['tx_count', 'montant'])
+
+
+@event.listens_for(Transaction, 'after_insert')
+def track_rollup_on_insert(mapper, connection, target):
+    _increment_rollup(connection, target.date_transaction, target.action, target.status, 1, target.montant)
+
+
+@event.listens_for(Transaction, 'after_update')
+def track_rollup_on_update(mapper, connection, target):
+    state = inspect(target)
+    if not any(state.attrs[name].history.has_changes()
+               for name in ('date_transaction', 'action', 'status', 'montant')):
+        return
+
+    old_montant = _previous_value(target, 'montant')
+    _increment_rollup(connection, _previous_value(target, 'date_transaction'), _previous_value(target, 'action'),
+                      _previous_value(target, 'status'), -1, -Decimal(str(old_montant or 0)))
+    _increment_rollup(connection, target.date_transaction, target.action, target.status, 1, target.montant)
+
+
+@event.listens_for(Transaction, 'after_delete')
+def track_rollup_on_delete(mapper, connection, target):
+    _increment_rollup(connection, target.date_transaction, target.action, target.status,
+                      -1, -Decimal(str(target.montant or 0)))
+
+
+def track_bulk_transaction_changes(connection, changes):
+    """Fold transactions changed by a bulk UPDATE/INSERT (no mapper events) into the ledger and rollup.
+
+    `changes` is a list of (before, after) dicts with user_id, action, status, montant and date_transaction;
+    `before` is None for inserted rows.
+    """
+    zero = Decimal('0')
+    balances = {}
+    buckets = {}
+    for before, after in changes:
+        for row, sign in ((before, -1), (after, 1)):
+            if row is None:
+                continue
+            contribution = _balance_contribution(row['action'], row['status'], row['montant'])
+            totals = balances.setdefault(row['user_id'], [zero, zero, zero])
+            for i, amount in enumerate(contribution):
+                totals[i] += sign * amount
+
+            key = ((row['date_transaction'] or datetime.utcnow()).date(), row['action'], _as_status(row['status']))
+            bucket = buckets.setdefault(key, [0, zero])
+            bucket[0] += sign
+            bucket[1] += sign * Decimal(str(row['montant'] or 0))
+
+    for user_id, delta in balances.items():
+        _apply_balance_delta(connection, user_id, tuple(delta))
+    for (day, action, status), (count, montant) in buckets.items():
+        if count or montant:
+            _increment_rollup(connection, datetime.combine(day, datetime.min.time()), action, status, count, montant)
+
+
+# Referral gains: created and settled in batches by a deferred job, off the recharge request path
+REFERRAL_GAIN_RATE = Decimal('0.1')
+
+
+def create_referral_gains(connection, batch_size=1000):
+    """Create the pending gain and Parrainage of every recharge from a referred user that has none.
+
+    Idempotent: a recharge is skipped once a Parrainage points at it, and the unique
+    idSourceTransaction makes a concurrent duplicate run fail instead of paying twice.
+    There is no date cutoff, so recharges missed while the job was down are still paid.
+    Returns the number of gains created.
+    """
+    transactions = Transaction.__table__
+    parrainages = Parrainage.__table__
+    users = User.__table__
+    referrers = users.alias('referrer')
+
+    pending = (
+        select(transactions.c.id, transactions.c.user_id, transactions.c.montant, users.c.code_parrainage)
+        .join(users, users.c.id == transactions.c.user_id)
+        .join(referrers, referrers.c.id == users.c.code_parrainage)
+        .outerjoin(parrainages, parrainages.c.idSourceTransaction == transactions.c.id)
+        .where(
+            transactions.c.action == 'recharge',
+            transactions.c.status != TransactionStatus.FAILED,
+            parrainages.c.idParainnage.is_(None)
+        )
+        .order_by(transactions.c.id)
+        .limit(batch_size)
+    )
+
+    created = 0
+    last_id = None
+    while True:
+        query = pending if last_id is None else pending.where(transactions.c.id > last_id)
+        recharges = connection.execute(query).all()
+        if not recharges:
+            break
+        last_id = recharges[-1].id
+
+        now = datetime.utcnow()
+        gain_rows = []
+        parrainage_rows = []
+        changes = []
+        ids = iter(generate_ids(2 * len(recharges)))
+        for recharge in recharges:
+            gain_id = next(ids)
+            montant = (Decimal(str(recharge.montant)) * REFERRAL_GAIN_RATE).quantize(Decimal('0.01'))
+            gain = {
+                'id': gain_id,
+                'user_id': recharge.code_parrainage,
+                'date_transaction': now,
+                'action': 'gain',
+                'montant': montant,
+                'commentaire': 'Parrainage',
+                'status': TransactionStatus.PENDING,
+                'version': 1
+            }
+            gain_rows.append(gain)
+            parrainage_rows.append({
+                'idParainnage': next(ids),
+                'idTransaction': gain_id,
+                'idSourceTransaction': recharge.id,
+                'idNewUser': recharge.user_id,
+                'idOldUser': recharge.code_parrainage,
+                'date': now,
+                'statut': TransactionStatus.PENDING,
+                'montant': montant
+            })
+            changes.append((None, gain))
+
+        connection.execute(transactions.insert(), gain_rows)
+        connection.execute(parrainages.insert(), parrainage_rows)
+        track_bulk_transaction_changes(connection, changes)
+        created += len(gain_rows)
+        if len(recharges) < batch_size:
+            break
+    return created
+
+
+def settle_referral_gains(connection):
+    """Complete (or fail) every pending referral gain whose source recharge has been decided.
+
+    One UPDATE per outcome on transactions and on parrainages, guarded by status = PENDING
+    so reruns change nothing. Returns {'COMPLETED': n, 'FAILED': n}.
+    """
+    gains = Transaction.__table__
+    sources = Transaction.__table__.alias('source')
+    parrainages = Parrainage.__table__
+
+    query = (
+        select(
+            parrainages.c.idParainnage, gains.c.id, gains.c.user_id, gains.c.action, gains.c.montant,
+            gains.c.status, gains.c.date_transaction, sources.c.status.label('source_status')
+        )
+        .join(gains, gains.c.id == parrainages.c.idTransaction)
+        .join(sources, sources.c.id == parrainages.c.idSourceTransaction)
+        .where(
+            gains.c.status == TransactionStatus.PENDING,
+            sources.c.status.in_([TransactionStatus.COMPLETED, TransactionStatus.FAILED])
+        )
+    )
+    if connection.dialect.name == 'mysql':
+        # Hold the gains until the UPDATEs so the deltas below stay exact
+        query = query.with_for_update(of=gains)
+    rows = connection.execute(query).all()
+
+    settled = {TransactionStatus.COMPLETED.name: 0, TransactionStatus.FAILED.name: 0}
+    for outcome in (TransactionStatus.COMPLETED, TransactionStatus.FAILED):
+        batch = [row for row in rows if row.source_status == outcome]
+        if not batch:
+            continue
+        result = connection.execute(
+            gains.update()
+            .where(gains.c.id.in_([row.id for row in batch]), gains.c.status == TransactionStatus.PENDING)
+            .values(status=outcome, version=gains.c.version + 1)
+        )
+        connection.execute(
+            parrainages.update()
+            .where(parrainages.c.idParainnage.in_([row.idParainnage for row in batch]))
+            .values(statut=outcome)
+        )
+
+        if result.rowcount == len(batch):
+            changes = []
+            for row in batch:
+                before = {
+                    'user_id': row.user_id, 'action': row.action, 'status': row.status,
+                    'montant': row.montant, 'date_transaction': row.date_transaction
+                }
+                changes.append((before, dict(before, status=outcome)))
+            track_bulk_transaction_changes(connection, changes)
+        else:
+            # Someone decided some of these gains meanwhile: recompute rather than guess
+            rebuild_user_balances(connection, list({row.user_id for row in batch}))
+            rebuild_finance_rollup(connection, {row.date_transaction.date() for row in batch if row.date_transaction})
+        settled[outcome.name] = result.rowcount
+    return settled
+
+
+# Referral tree: referral_closure follows users.code_parrainage (the referrer's id)
+REFERRAL_MAX_DEPTH = 1000
+
+
+def referral_downline_ids(connection, user_id):
+    """Ids of `user_id` and everyone below it"""
+    table = ReferralClosure.__table__
+    return connection.execute(select(table.c.descendant_id).where(table.c.ancestor_id == user_id)).scalars().all()
+
+
+def _closure_attach(connection, user_id, parent_id):
+    """Hang the subtree rooted at `user_id` under `parent_id` and all of its ancestors"""
+    table = ReferralClosure.__table__
+    above = table.alias('above')
+    below = table.alias('below')
+    rows = connection.execute(
+        select(above.c.ancestor_id, below.c.descendant_id, above.c.depth + below.c.depth + 1)
+        .select_from(above.join(below, true()))  # every ancestor of the parent x every node of the subtree
+        .where(above.c.descendant_id == parent_id, below.c.ancestor_id == user_id)
+    ).all()
+    if rows:
+        connection.execute(table.insert(), [
+            {'ancestor_id': ancestor, 'descendant_id': descendant, 'depth': depth}
+            for ancestor, descendant, depth in rows
+        ])
+
+
+def _closure_detach(connection, user_id):
+    """Cut the subtree rooted at `user_id` from everything above it"""
+    table = ReferralClosure.__table__
+    ancestors = connection.execute(
+        select(table.c.ancestor_id).where(table.c.descendant_id == user_id, table.c.ancestor_id != user_id)
+    ).scalars().all()
+    if ancestors:
+        # Ids are read first: MySQL cannot DELETE from a table it selects from in a subquery
+        connection.execute(table.delete().where(
+            table.c.descendant_id.in_(referral_downline_ids(connection, user_id)),
+            table.c.ancestor_id.in_(ancestors)
+        ))
+
+
+def rebuild_referral_closure(connection, batch_size=1000):
+    """Recompute referral_closure from users.code_parrainage, one INSERT ... SELECT per level"""
+    table = ReferralClosure.__table__
+    users = User.__table__
+    connection.execute(table.delete())
+
+    user_ids = connection.execute(select(users.c.id)).scalars().all()
+    for start in range(0, len(user_ids), batch_size):
+        connection.execute(table.insert(), [
+            {'ancestor_id': user_id, 'descendant_id': user_id, 'depth': 0}
+            for user_id in user_ids[start:start + batch_size]
+        ])
+
+    # Level d + 1 = each user under every ancestor its referrer has at level d
+    depth = 0
+    while depth < REFERRAL_MAX_DEPTH:
+        level = (
+            select(table.c.ancestor_id, users.c.id, table.c.depth + 1)
+            .join(table, table.c.descendant_id == users.c.code_parrainage)
+            .where(table.c.depth == depth, users.c.id != table.c.ancestor_id)
+        )
+        rows = connection.execute(level).all()
+        if not rows:
+            break
+        for start in range(0, len(rows), batch_size):
+            connection.execute(table.insert(), [
+                {'ancestor_id': ancestor, 'descendant_id': descendant, 'depth': level_depth}
+                for ancestor, descendant, level_depth in rows[start:start + batch_size]
+            ])
+        depth += 1
+
+
+@event.listens_for(User, 'after_insert')
+def add_user_to_referral_tree(mapper, connection, user):
+    connection.execute(ReferralClosure.__table__.insert().values(
+        ancestor_id=user.id, descendant_id=user.id, depth=0
+    ))
+    if user.code_parrainage:
+        _closure_attach(connection, user.id, user.code_parrainage)
+
+
+@event.listens_for(User, 'after_update')
+def move_user_in_referral_tree(mapper, connection, user):
+    history = inspect(user).attrs.code_parrainage.history
+    if not history.has_changes():
+        return
+    _closure_detach(connection, user.id)
+    if user.code_parrainage:
+        if user.code_parrainage in referral_downline_ids(connection, user.id):
+            raise ValueError('A user cannot be referred by someone in their own downline')
+        _closure_attach(connection, user.id, user.code_parrainage)
@@ -7,6 +7,9 @@ admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 # Dashboard stats
 admin_bp.route('/dashboard-stats', methods=['GET'])(AdminController.get_dashboard_stats)
 
+# Aggregate cache counters (hit/stale/miss/coalesced)
+admin_bp.route('/cache-stats', methods=['GET'])(AdminController.get_cache_stats)
+
 # Dashboard finance (today's transactions)
 admin_bp.route('/dashboard-finance', methods=['GET'])(AdminController.get_dashboard_finance)
 
@@ -22,3 +25,8 @@ admin_bp.route('/transactionNormal', methods=['GET'])(AdminController.transactio
 # Transaction parrainage
 admin_bp.route('/transactionParrainage', methods=['GET'])(AdminController.transactionParrainage)
 
+# Export transactions (streamed NDJSON/CSV)
+admin_bp.route('/transactions/export', methods=['GET'])(AdminController.export_transactions)
+
+# Create and settle pending referral gains now
+admin_bp.route('/referrals/settle', methods=['POST'])(AdminController.settle_referrals)
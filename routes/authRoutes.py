@@ -8,3 +8,9 @@ auth_bp.route('/login/user', methods=['POST'])(AuthController.login_user)
 
 # Admin login
 auth_bp.route('/login/admin', methods=['POST'])(AuthController.login_admin)
+
+# Rotate a refresh token into a new token pair
+auth_bp.route('/refresh', methods=['POST'])(AuthController.refresh_token)
+
+# Revoke the session of a refresh token
+auth_bp.route('/logout', methods=['POST'])(AuthController.logout)
@@ -33,4 +33,7 @@ balance_bp.route('/history', methods=['GET'])(BalanceController.get_all_transact
 
 balance_bp.route('/parrainage/<user_id>', methods=['GET'])(BalanceController.getParainnage)
 
+# Referral downline per level (members, referral gains)
+balance_bp.route('/parrainage/<user_id>/downline', methods=['GET'])(BalanceController.get_downline)
+
 balance_bp.route('/admin/pending', methods=['GET'])(BalanceController.get_all_pending_transactions)
\ No newline at end of file
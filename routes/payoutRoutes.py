@@ -0,0 +1,16 @@
+from flask import Blueprint
+from controllers.payoutController import PayoutController
+
+payout_bp = Blueprint('payout', __name__, url_prefix='/api/admin/payouts')
+
+# Payable withdrawals grouped by coin and network
+payout_bp.route('/pending', methods=['GET'])(PayoutController.get_pending_groups)
+
+# Batch payable withdrawals, one batch per (coin, reseau)
+payout_bp.route('/batches', methods=['POST'])(PayoutController.create_batches)
+
+# List payout batches (?limit, ?cursor)
+payout_bp.route('/batches', methods=['GET'])(PayoutController.list_batches)
+
+# Streamed payout file of a batch (?format=csv|ndjson)
+payout_bp.route('/batches/<batch_id>/file', methods=['GET'])(PayoutController.export_batch)
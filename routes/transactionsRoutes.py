@@ -3,6 +3,18 @@ from controllers.transactionController import TransactionController
 
 transactions_bp = Blueprint('transactions', __name__, url_prefix='/api/transactions')
 
+# POST /api/transactions/batch - Approve or reject pending transactions in bulk
+transactions_bp.route('/batch', methods=['POST'])(TransactionController.batch_update_transactions)
+
+# POST /api/transactions/queue/claim - Lease the next pending transactions (?limit)
+transactions_bp.route('/queue/claim', methods=['POST'])(TransactionController.claim_review_queue)
+
+# POST /api/transactions/queue/<id>/decision - Decide a claimed transaction and release it
+transactions_bp.route('/queue/<transaction_id>/decision', methods=['POST'])(TransactionController.decide_review_item)
+
+# POST /api/transactions/queue/<id>/release - Release a claim without deciding
+transactions_bp.route('/queue/<transaction_id>/release', methods=['POST'])(TransactionController.release_review_item)
+
 # PUT /api/transactions/<id> - Update transaction
 transactions_bp.route('/<transaction_id>', methods=['PUT'])(TransactionController.update_transaction)
 
@@ -0,0 +1,90 @@
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+import jwt
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault('LOG_DIR', _tmp)
+os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+
+import config  # noqa: E402
+config.Config.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(_tmp, 'test.db')
+
+from app import app as flask_app  # noqa: E402
+from extension import db, limiter  # noqa: E402
+from models import Admin, User, Qualification  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config['TESTING'] = True
+    limiter.enabled = False
+    return flask_app
+
+
+@pytest.fixture(autouse=True)
+def database(app):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for valeur, nom in enumerate(['DEBUTANT', 'VALIDER']):
+            db.session.add(Qualification(valeur=valeur, nom=nom))
+        db.session.commit()
+    yield
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def make_token(**claims):
+    claims['exp'] = datetime.now(timezone.utc) + timedelta(hours=1)
+    return jwt.encode(claims, flask_app.config['SECRET_KEY'], algorithm='HS256')
+
+
+@pytest.fixture
+def admin_headers(app):
+    with app.app_context():
+        admin = Admin(email='admin@test', mot_de_passe='secret')
+        db.session.add(admin)
+        db.session.commit()
+        return {'Authorization': 'Bearer ' + make_token(admin_id=admin.id, is_admin=True)}
+
+
+@pytest.fixture
+def user_factory(app):
+    def create(email, **fields):
+        with app.app_context():
+            user = User(nom='test', email=email, mot_de_passe='secret', **fields)
+            db.session.add(user)
+            db.session.commit()
+            return user.id, {'Authorization': 'Bearer ' + make_token(user_id=user.id)}
+    return create
+
+
+@pytest.fixture
+def query_counter(app):
+    """count(fn) -> (statements executed while running fn, fn's result)"""
+    from sqlalchemy import event
+
+    with app.app_context():
+        engine = db.engine
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+
+    def count(fn):
+        del statements[:]
+        result = fn()
+        return len(statements), result
+
+    yield count
+    event.remove(engine, 'before_cursor_execute', record)
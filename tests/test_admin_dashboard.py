@@ -0,0 +1,28 @@
+from datetime import datetime
+
+from extension import db
+from models import Transaction, TransactionStatus
+
+
+def test_dashboard_finance_lists_the_day_and_totals_completed_amounts(app, client, admin_headers, user_factory):
+    user_id, _ = user_factory('u@test')
+    day = datetime(2026, 3, 2, 10, 30)
+    with app.app_context():
+        db.session.add_all([
+            Transaction(user_id=user_id, action='recharge', montant=100, status=TransactionStatus.COMPLETED,
+                        date_transaction=day),
+            Transaction(user_id=user_id, action='recharge', montant=7, status=TransactionStatus.PENDING,
+                        date_transaction=day),
+            Transaction(user_id=user_id, action='retrait', montant=30, status=TransactionStatus.COMPLETED,
+                        date_transaction=day),
+            Transaction(user_id=user_id, action='recharge', montant=50, status=TransactionStatus.COMPLETED,
+                        date_transaction=datetime(2026, 3, 3, 9, 0)),
+        ])
+        db.session.commit()
+
+    response = client.get('/api/admin/dashboard-finance?date=2026-03-02', headers=admin_headers)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['total_transaction'] == 3
+    assert (body['total_recharge'], body['total_retrait']) == (100, 30)
+    assert {row['user'] for row in body['transactions']} == {'test'}
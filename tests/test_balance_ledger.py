@@ -0,0 +1,45 @@
+from decimal import Decimal
+
+from sqlalchemy import event
+
+from extension import db
+from models import Transaction, TransactionStatus, UserBalance
+
+
+def test_status_assigned_after_commit_updates_the_ledger_in_place(app, user_factory):
+    user_id, _ = user_factory('u@test')
+    with app.app_context():
+        transaction = Transaction(user_id=user_id, action='recharge', montant=25, status=TransactionStatus.PENDING)
+        db.session.add(transaction)
+        db.session.commit()  # expires every attribute: the assignment below has no old value loaded
+
+        transaction.status = TransactionStatus.COMPLETED
+        executed = []
+
+        def record(conn, cursor, statement, *args):
+            executed.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            db.session.commit()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        assert not [statement for statement in executed if statement.startswith('DELETE FROM user_balances')]
+        ledger = db.session.get(UserBalance, user_id, populate_existing=True)
+        assert (ledger.recharges, ledger.retraits, ledger.gains) == (Decimal('25'), 0, 0)
+
+
+def test_user_change_on_expired_transaction_moves_the_amount(app, user_factory):
+    first_id, _ = user_factory('first@test')
+    second_id, _ = user_factory('second@test')
+    with app.app_context():
+        transaction = Transaction(user_id=first_id, action='recharge', montant=10, status=TransactionStatus.COMPLETED)
+        db.session.add(transaction)
+        db.session.commit()
+
+        transaction.user_id = second_id
+        db.session.commit()
+
+        balances = {row.user_id: row.balance for row in UserBalance.query.populate_existing().all()}
+        assert balances == {first_id: 0.0, second_id: 10.0}
@@ -0,0 +1,56 @@
+import pytest
+
+from extension import db
+from models import Boost, Commande, CommandeStatut, Produit, Revendeur
+
+
+def add_boosts(app, user_id, count, nb_produits=4):
+    with app.app_context():
+        revendeur = Revendeur(nom='r', plateforme='p')
+        db.session.add(revendeur)
+        db.session.flush()
+        produits = [Produit(nom_produit=f'p{i}', prix=10, commission=1, revendeur_id=revendeur.id)
+                    for i in range(nb_produits)]
+        db.session.add_all(produits)
+        db.session.flush()
+        commande = Commande(description_commande='d', code=f'C{count}-{user_id}', cout=1, commission_total=2,
+                            tableauProduit=[p.idProduit for p in produits], statut=CommandeStatut.EN_ATTENTE)
+        db.session.add(commande)
+        db.session.flush()
+        db.session.add_all([Boost(idCommande=commande.idCommande, idUtilisateur=user_id) for _ in range(count)])
+        db.session.commit()
+        return commande.idCommande
+
+
+@pytest.mark.parametrize('path', ['/api/boost/all', '/api/boost/status/à validé'])
+def test_admin_boost_lists_run_a_fixed_number_of_queries(app, client, admin_headers, user_factory,
+                                                         query_counter, path):
+    user_id, _ = user_factory('u@test')
+    add_boosts(app, user_id, 2)
+    client.get(path, headers=admin_headers)  # warms the principal cache
+    few, response = query_counter(lambda: client.get(path, headers=admin_headers))
+    assert response.status_code == 200
+    assert len(response.get_json()) == 2
+
+    add_boosts(app, user_id, 8)
+    many, response = query_counter(lambda: client.get(path, headers=admin_headers))
+    assert len(response.get_json()) == 10
+    assert many == few
+
+
+def test_user_boosts_run_a_fixed_number_of_queries(app, client, user_factory, query_counter):
+    user_id, headers = user_factory('u@test')
+    commande_id = add_boosts(app, user_id, 2)
+    client.get('/api/boost/user_boost', headers=headers)  # warms the principal cache
+    few, response = query_counter(lambda: client.get('/api/boost/user_boost', headers=headers))
+    assert response.status_code == 200
+    few_commande, _ = query_counter(lambda: client.get(f'/api/boost/commande/{commande_id}', headers=headers))
+
+    with app.app_context():
+        db.session.add_all([Boost(idCommande=commande_id, idUtilisateur=user_id) for _ in range(8)])
+        db.session.commit()
+    many, response = query_counter(lambda: client.get('/api/boost/user_boost', headers=headers))
+    assert len(response.get_json()) == 10
+    assert all(len(boost['statProduitBoost']) == 4 for boost in response.get_json())
+    many_commande, _ = query_counter(lambda: client.get(f'/api/boost/commande/{commande_id}', headers=headers))
+    assert (many, many_commande) == (few, few_commande)
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select
+
+from extension import db
+from models import FinanceDailyRollup, Transaction, TransactionStatus
+
+
+def rollup_rows():
+    return sorted(
+        (row.day, row.action, row.status.name, row.tx_count, float(row.montant))
+        for row in db.session.execute(select(FinanceDailyRollup)).scalars()
+        if row.tx_count
+    )
+
+
+def test_update_of_expired_attributes_moves_the_amount(app, user_factory):
+    user_id, _ = user_factory('u@test')
+    today = datetime.utcnow()
+    with app.app_context():
+        transaction = Transaction(user_id=user_id, action='retrait', montant=40, status=TransactionStatus.PENDING,
+                                  date_transaction=today - timedelta(days=1))
+        db.session.add(transaction)
+        db.session.add(Transaction(user_id=user_id, action='retrait', montant=5, status=TransactionStatus.PENDING))
+        db.session.commit()
+
+        db.session.expire(transaction)
+        transaction.status = TransactionStatus.COMPLETED
+        transaction.date_transaction = today
+        db.session.commit()
+
+        assert rollup_rows() == [
+            (today.date(), 'retrait', 'COMPLETED', 1, 40.0),
+            (today.date(), 'retrait', 'PENDING', 1, 5.0),
+        ]
+
+
+def test_update_of_expired_attributes_does_not_rebuild_the_rollup(app, user_factory):
+    user_id, _ = user_factory('u@test')
+    with app.app_context():
+        transaction = Transaction(user_id=user_id, action='recharge', montant=10, status=TransactionStatus.PENDING)
+        db.session.add(transaction)
+        db.session.commit()
+        db.session.expire(transaction)
+        transaction.status = TransactionStatus.COMPLETED
+
+        executed = []
+
+        def record(conn, cursor, statement, *args):
+            executed.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            db.session.commit()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        assert not [statement for statement in executed if statement.startswith('DELETE FROM finance_daily_rollup')]
+        assert rollup_rows() == [(datetime.utcnow().date(), 'recharge', 'COMPLETED', 1, 10.0)]
@@ -0,0 +1,32 @@
+import os
+import re
+
+import pytest
+
+import utils
+from utils import generate_id, generate_ids
+
+
+def test_ids_stay_distinct_under_a_case_insensitive_collation():
+    ids = generate_ids(5000) + [generate_id() for _ in range(100)]
+    assert all(re.fullmatch(r'[0-9A-Z]{12}', id_) for id_ in ids)
+    assert len({id_.lower() for id_ in ids}) == len(ids)
+
+
+def test_ids_are_ordered_by_creation_second():
+    first, second = generate_id(), generate_ids(3)
+    assert first[:6] <= second[0][:6]
+    assert {id_[6:9] for id_ in [first] + second} == {utils._allocator._node}
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+def test_forked_worker_derives_its_node_from_its_own_pid():
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(write_end, (generate_id()[6:9] + utils._node_id()).encode('ascii'))
+        os._exit(0)
+    os.waitpid(pid, 0)
+    reply = os.read(read_end, 6).decode('ascii')
+    assert reply[:3] == reply[3:]
+    assert utils._allocator._node == utils._node_id()
@@ -0,0 +1,30 @@
+import json
+import logging
+import os
+
+from util.logging_config import JsonFormatter, SizedTimedRotatingFileHandler
+
+
+def test_size_rollovers_keep_the_newest_backups(tmp_path):
+    handler = SizedTimedRotatingFileHandler(str(tmp_path / 'app.log'), maxBytes=300, when='midnight',
+                                            backupCount=2, utc=True)
+    handler.setFormatter(JsonFormatter())
+    logger = logging.getLogger('test_rotation')
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        for i in range(40):
+            logger.warning('record %d', i)
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+
+    backups = sorted(name for name in os.listdir(tmp_path) if name != 'app.log')
+    assert len(backups) == 2
+    kept = []
+    for name in sorted(backups, key=lambda name: int(name.rsplit('.', 1)[1])) + ['app.log']:
+        with open(tmp_path / name) as log_file:
+            kept += [int(json.loads(line)['message'].split()[1]) for line in log_file]
+    # Everything still on disk is the most recent, contiguous run of records
+    assert kept == list(range(40 - len(kept), 40))
+    assert len(kept) > 3
@@ -0,0 +1,81 @@
+import time
+
+import bcrypt
+import pytest
+from flask import Flask
+
+from util.passwords import PasswordPool, PasswordPoolBusy, password_pool
+
+
+@pytest.fixture
+def slow_pool():
+    pool = PasswordPool(size=1, queue_limit=1, timeout=0.2)
+    pool._submit(time.sleep, 0)  # start the worker process outside the timed calls
+    yield pool
+    pool._executor.shutdown(wait=True)
+
+
+def test_timeout_is_reported_as_busy(slow_pool):
+    with pytest.raises(PasswordPoolBusy):
+        slow_pool._submit(time.sleep, 1)
+
+
+def test_slot_stays_taken_while_the_worker_still_runs(slow_pool):
+    with pytest.raises(PasswordPoolBusy):
+        slow_pool._submit(time.sleep, 1)
+    # The caller gave up but the worker is still sleeping: the only slot is not free yet
+    started = time.monotonic()
+    with pytest.raises(PasswordPoolBusy):
+        slow_pool._submit(time.sleep, 0)
+    assert time.monotonic() - started < 0.1
+
+    time.sleep(1)
+    assert slow_pool._submit(time.sleep, 0) is None
+
+
+def test_new_users_are_hashed_on_the_pool(app, client, monkeypatch):
+    calls = []
+    original = password_pool.hash
+    monkeypatch.setattr(password_pool, 'hash', lambda password: calls.append(password) or original(password))
+
+    response = client.post('/api/users', json={'nom': 'n', 'email': 'new@test', 'mot_de_passe': 'pw'})
+    assert response.status_code == 201
+    assert calls == ['pw']
+
+
+def test_signup_answers_503_when_the_pool_is_saturated(app, client, monkeypatch):
+    def busy(password):
+        raise PasswordPoolBusy()
+    monkeypatch.setattr(password_pool, 'hash', busy)
+
+    response = client.post('/api/users', json={'nom': 'n', 'email': 'new@test', 'mot_de_passe': 'pw'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_admin_profile_password_is_stored_hashed(app, client, admin_headers):
+    response = client.put('/api/admin/profile', json={
+        'current_password': 'secret', 'new_email': 'admin@test', 'new_password': 'changed'
+    }, headers=admin_headers)
+    assert response.status_code == 200
+    from models import Admin
+    with app.app_context():
+        stored = Admin.query.filter_by(email='admin@test').one().mot_de_passe
+    assert bcrypt.checkpw(b'changed', stored.encode('utf-8'))
+
+
+def test_settings_come_from_the_app_config():
+    config_app = Flask(__name__)
+    config_app.config.update(BCRYPT_POOL_SIZE=1, BCRYPT_QUEUE_LIMIT=2, BCRYPT_TIMEOUT=5, BCRYPT_LOG_ROUNDS=5)
+    pool = PasswordPool()
+    pool.init_app(config_app)
+    try:
+        hashed = pool.hash('pw')
+        assert hashed.split('$')[2] == '05'
+        assert pool.verify('pw', hashed) == (True, None)
+    finally:
+        pool._executor.shutdown(wait=True)
+
+
+def test_app_pool_uses_the_same_cost_as_flask_bcrypt(app):
+    assert password_pool.rounds == app.config['BCRYPT_LOG_ROUNDS']
@@ -0,0 +1,22 @@
+import re
+
+from extension import db
+from models import PayoutBatch
+
+
+def test_export_filename_keeps_only_safe_characters(app, client, admin_headers):
+    with app.app_context():
+        batch = PayoutBatch(coin='USDT"; x=../../', reseau='TRC 20\r\nSet-Cookie: a=b')
+        db.session.add(batch)
+        db.session.commit()
+        batch_id = batch.idBatch
+
+    response = client.get(f'/api/admin/payouts/batches/{batch_id}/file', headers=admin_headers)
+    assert response.status_code == 200
+    disposition = response.headers['Content-Disposition']
+    filename = disposition[len('attachment; filename='):]
+    assert disposition.startswith('attachment; filename=payout_USDT')
+    assert re.fullmatch(r'[A-Za-z0-9_.-]+', filename) and filename.endswith(f'_{batch_id}.csv')
+    assert '/' not in filename and '"' not in filename
+    assert 'Set-Cookie' not in response.headers
+    assert response.get_data(as_text=True).startswith('transaction_id,')
@@ -0,0 +1,23 @@
+from flask import Flask
+
+from util.auth_utils import PrincipalCache
+
+
+def test_limits_come_from_the_app_config(app, user_factory, query_counter):
+    user_id, _ = user_factory('u@test')
+    config_app = Flask(__name__)
+    config_app.config.update(AUTH_CACHE_SIZE=1, AUTH_CACHE_TTL=0)
+    cache = PrincipalCache('AUTH_CACHE_SIZE', 'AUTH_CACHE_TTL')
+    cache.init_app(config_app)
+    assert (cache.maxsize, cache.ttl) == (1, 0)
+
+    with app.app_context():
+        # A zero TTL never serves from memory: every lookup reads the user again
+        first, principal = query_counter(lambda: cache.get('user', user_id))
+        second, _ = query_counter(lambda: cache.get('user', user_id))
+        assert principal.id == user_id and first == second == 1
+
+        config_app.config['AUTH_CACHE_TTL'] = 60
+        cache.init_app(config_app)
+        cache.get('user', user_id)
+        assert query_counter(lambda: cache.get('user', user_id))[0] == 0
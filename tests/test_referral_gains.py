@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from controllers.balanceController import BalanceController
+from extension import db
+from models import Parrainage, Transaction, TransactionStatus, create_referral_gains
+
+
+def test_old_recharge_without_a_gain_is_paid_once(app, user_factory):
+    referrer_id, _ = user_factory('referrer@test')
+    referred_id, _ = user_factory('referred@test', code_parrainage=referrer_id)
+    with app.app_context():
+        recharge = Transaction(user_id=referred_id, action='recharge', montant=50, status=TransactionStatus.COMPLETED,
+                               date_transaction=datetime.utcnow() - timedelta(days=60))
+        db.session.add(recharge)
+        db.session.commit()
+
+        assert BalanceController.settle_referrals()['created'] == 1
+        assert BalanceController.settle_referrals()['created'] == 0
+
+        parrainage = Parrainage.query.filter_by(idSourceTransaction=recharge.id).one()
+        gain = db.session.get(Transaction, parrainage.idTransaction)
+        assert (gain.user_id, gain.montant, gain.status) == (referrer_id, Decimal('5.00'), TransactionStatus.COMPLETED)
+
+
+def test_gains_are_created_across_batches(app, user_factory):
+    referrer_id, _ = user_factory('referrer@test')
+    referred_id, _ = user_factory('referred@test', code_parrainage=referrer_id)
+    with app.app_context():
+        db.session.add_all([
+            Transaction(user_id=referred_id, action='recharge', montant=10, status=TransactionStatus.PENDING)
+            for _ in range(5)
+        ])
+        db.session.commit()
+
+        with db.engine.begin() as connection:
+            assert create_referral_gains(connection, batch_size=2) == 5
+        with db.engine.begin() as connection:
+            assert create_referral_gains(connection, batch_size=2) == 0
+        assert Parrainage.query.count() == 5
@@ -0,0 +1,80 @@
+from datetime import datetime
+
+from conftest import make_token
+from extension import db
+from models import Admin, Transaction, TransactionStatus
+
+
+def other_admin_headers(app):
+    with app.app_context():
+        admin = Admin(email='other@test', mot_de_passe='secret')
+        db.session.add(admin)
+        db.session.commit()
+        return {'Authorization': 'Bearer ' + make_token(admin_id=admin.id, is_admin=True)}
+
+
+def pending_transaction(app, user_id):
+    with app.app_context():
+        transaction = Transaction(user_id=user_id, action='retrait', montant=20, status=TransactionStatus.PENDING)
+        db.session.add(transaction)
+        db.session.commit()
+        return transaction.id, transaction.version
+
+
+def test_update_checks_the_version_only_when_given(app, client, admin_headers, user_factory):
+    user_id, _ = user_factory('u@test')
+    transaction_id, version = pending_transaction(app, user_id)
+
+    response = client.put(f'/api/transactions/{transaction_id}', json={'status': 'COMPLETED', 'version': version - 1},
+                          headers=admin_headers)
+    assert response.status_code == 409
+    assert response.get_json()['version'] == version
+
+    response = client.put(f'/api/transactions/{transaction_id}', json={'status': 'COMPLETED'}, headers=admin_headers)
+    assert response.status_code == 200
+
+
+def test_update_without_version_still_respects_claims(app, client, admin_headers, user_factory):
+    user_id, _ = user_factory('u@test')
+    transaction_id, _ = pending_transaction(app, user_id)
+    client.post('/api/transactions/queue/claim', headers=other_admin_headers(app))
+
+    response = client.put(f'/api/transactions/{transaction_id}', json={'status': 'COMPLETED'}, headers=admin_headers)
+    assert response.status_code == 409
+
+
+def test_update_cannot_override_another_admins_claim(app, client, admin_headers, user_factory):
+    user_id, _ = user_factory('u@test')
+    transaction_id, _ = pending_transaction(app, user_id)
+    claimed = client.post('/api/transactions/queue/claim', headers=other_admin_headers(app)).get_json()
+    version = claimed['transactions'][0]['version']
+
+    response = client.put(f'/api/transactions/{transaction_id}', json={'status': 'COMPLETED', 'version': version},
+                          headers=admin_headers)
+    assert response.status_code == 409
+    with app.app_context():
+        assert db.session.get(Transaction, transaction_id).status == TransactionStatus.PENDING
+
+
+def test_update_by_the_claiming_admin_releases_the_claim(app, client, admin_headers, user_factory):
+    user_id, _ = user_factory('u@test')
+    transaction_id, _ = pending_transaction(app, user_id)
+    version = client.post('/api/transactions/queue/claim', headers=admin_headers).get_json()['transactions'][0]['version']
+
+    response = client.put(f'/api/transactions/{transaction_id}', json={'status': 'COMPLETED', 'version': version},
+                          headers=admin_headers)
+    assert response.status_code == 200
+    with app.app_context():
+        transaction = db.session.get(Transaction, transaction_id)
+        assert transaction.status == TransactionStatus.COMPLETED
+        assert transaction.claimed_by is None
+
+
+def test_lease_length_comes_from_the_app_config(app, client, admin_headers, user_factory, monkeypatch):
+    monkeypatch.setitem(app.config, 'REVIEW_LEASE_SECONDS', 30)
+    user_id, _ = user_factory('u@test')
+    pending_transaction(app, user_id)
+
+    body = client.post('/api/transactions/queue/claim', headers=admin_headers).get_json()
+    lease = datetime.fromisoformat(body['lease_expires_at']) - datetime.utcnow()
+    assert 0 < lease.total_seconds() <= 30
@@ -0,0 +1,70 @@
+import time
+
+import jwt
+import pytest
+
+from extension import db
+from models import Admin
+from util.tokens import RevokedSessions
+
+
+def login(client, kind, email, password):
+    response = client.post(f'/api/auth/login/{kind}', json={'email': email, 'mot_de_passe': password})
+    assert response.status_code == 200, response.get_json()
+    body = response.get_json()
+    return {'Authorization': 'Bearer ' + body['token']}, body['refresh_token']
+
+
+def refresh(client, refresh_token):
+    return client.post('/api/auth/refresh', json={'refresh_token': refresh_token}).status_code
+
+
+@pytest.fixture
+def user_sessions(client, user_factory):
+    user_id, _ = user_factory('u@test')
+    return user_id, login(client, 'user', 'u@test', 'secret'), login(client, 'user', 'u@test', 'secret')
+
+
+def test_change_password_keeps_only_the_callers_session(client, user_sessions):
+    user_id, (current, current_refresh), (other, other_refresh) = user_sessions
+
+    response = client.put(f'/api/users/{user_id}/password',
+                          json={'precedent_mdp': 'secret', 'nouveau_mdp': 'changed'}, headers=current)
+    assert response.status_code == 200
+
+    assert client.get('/api/users/me', headers=current).status_code == 200
+    assert refresh(client, current_refresh) == 200
+    assert client.get('/api/users/me', headers=other).status_code == 401
+    assert refresh(client, other_refresh) == 401
+
+
+def test_admin_password_change_signs_out_the_admins_other_sessions(app, client):
+    with app.app_context():
+        db.session.add(Admin(email='admin@test', mot_de_passe='secret'))
+        db.session.commit()
+    current, current_refresh = login(client, 'admin', 'admin@test', 'secret')
+    other, other_refresh = login(client, 'admin', 'admin@test', 'secret')
+
+    response = client.put('/api/admin/profile', json={
+        'current_password': 'secret', 'new_email': 'admin@test', 'new_password': 'changed'
+    }, headers=current)
+    assert response.status_code == 200
+
+    assert refresh(client, current_refresh) == 200
+    assert refresh(client, other_refresh) == 401
+    assert client.get('/api/admin/dashboard-stats', headers=other).status_code == 401
+
+
+def test_token_lifetimes_come_from_the_app_config(app, client, user_factory, monkeypatch):
+    monkeypatch.setitem(app.config, 'ACCESS_TOKEN_TTL', 60)
+    monkeypatch.setitem(app.config, 'REVOCATION_REFRESH_SECONDS', 5)
+    user_factory('u@test')
+    response = client.post('/api/auth/login/user', json={'email': 'u@test', 'mot_de_passe': 'secret'})
+    body = response.get_json()
+    assert body['expires_in'] == 60
+    claims = jwt.decode(body['token'], app.config['SECRET_KEY'], algorithms=['HS256'])
+    assert 0 < claims['exp'] - time.time() <= 60
+
+    sessions = RevokedSessions('REVOCATION_REFRESH_SECONDS', 'ACCESS_TOKEN_TTL')
+    sessions.init_app(app)
+    assert (sessions.refresh_seconds, sessions.horizon_seconds) == (5, 60)
@@ -0,0 +1,26 @@
+from flask import Flask
+
+from util.singleflight import SingleFlightCache
+
+
+def make_cache(ttl, stale_ttl):
+    app = Flask(__name__)
+    app.config.update(AGGREGATE_CACHE_TTL=ttl, AGGREGATE_CACHE_STALE_TTL=stale_ttl)
+    cache = SingleFlightCache('AGGREGATE_CACHE_TTL', 'AGGREGATE_CACHE_STALE_TTL')
+    cache.init_app(app)
+    return app, cache
+
+
+def test_durations_come_from_the_app_config():
+    calls = []
+    app, cache = make_cache(60, 0)
+    with app.app_context():
+        assert cache.get('key', lambda: calls.append(1) or len(calls)) == 1
+        assert cache.get('key', lambda: calls.append(1) or len(calls)) == 1
+
+    app, cache = make_cache(0, 0)
+    with app.app_context():
+        cache.get('key', lambda: calls.append(1) or len(calls))
+        cache.get('key', lambda: calls.append(1) or len(calls))
+    assert len(calls) == 3
+    assert cache.stats()['miss'] == 2
@@ -1,27 +1,133 @@
 import jwt
 import functools
-from flask import request, jsonify, current_app
-from models import Admin
+import threading
+import time
+from collections import OrderedDict
+from flask import request, jsonify, current_app, g
+from sqlalchemy import event
+from models import Admin, User
+from util.tokens import revoked_sessions
 
-def admin_required(f):
-    @functools.wraps(f)
-    def decorated_function(*args, **kwargs):
+
+class Principal:
+    """Authenticated user or admin, a plain snapshot safe to share across requests and threads"""
+    __slots__ = ('kind', 'id', 'email', 'nom', 'code_parrainage')
+
+    def __init__(self, kind, record):
+        self.kind = kind
+        self.id = record.id
+        self.email = record.email
+        self.nom = getattr(record, 'nom', None)
+        self.code_parrainage = getattr(record, 'code_parrainage', None)
+
+    def __repr__(self):
+        return f'<Principal {self.kind} {self.id}>'
+
+
+class PrincipalCache:
+    """Bounded LRU of principals, each entry trusted for `ttl` seconds.
+
+    Per worker: updates and deletes evict the entry locally, other workers
+    see the change when their entry expires. Both limits are read from the
+    app config by init_app().
+    """
+
+    MODELS = {'user': User, 'admin': Admin}
+
+    def __init__(self, maxsize_setting, ttl_setting):
+        self.maxsize_setting = maxsize_setting
+        self.ttl_setting = ttl_setting
+        self.maxsize = 0
+        self.ttl = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def init_app(self, app):
+        with self._lock:
+            self.maxsize = app.config[self.maxsize_setting]
+            self.ttl = app.config[self.ttl_setting]
+            self._entries.clear()
+
+    def get(self, kind, id_):
+        """The principal for (kind, id_), loaded from the DB on a miss; None if no such record"""
+        if not id_:
+            return None
+        key = (kind, id_)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry[1] < self.ttl:
+                self._entries.move_to_end(key)
+                return entry[0]
+
+        record = self.MODELS[kind].query.filter_by(id=id_).first()
+        if not record:
+            return None
+        principal = Principal(kind, record)
+        with self._lock:
+            self._entries[key] = (principal, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return principal
+
+    def invalidate(self, kind, id_):
+        with self._lock:
+            self._entries.pop((kind, id_), None)
+
+
+principal_cache = PrincipalCache('AUTH_CACHE_SIZE', 'AUTH_CACHE_TTL')
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def forget_user_principal(mapper, connection, user):
+    principal_cache.invalidate('user', user.id)
+
+
+@event.listens_for(Admin, 'after_update')
+@event.listens_for(Admin, 'after_delete')
+def forget_admin_principal(mapper, connection, admin):
+    principal_cache.invalidate('admin', admin.id)
+
+
+class RevokedTokenError(jwt.InvalidTokenError):
+    """Access token of a session that was logged out or revoked"""
+
+
+def token_payload():
+    """JWT claims of the current request, decoded once and kept on `g`.
+
+    Returns None when there is no Bearer token; raises jwt.InvalidTokenError on a bad
+    or revoked one (checked against the in-memory revoked sessions, no DB query).
+    """
+    if 'token_payload' not in g:
         auth_header = request.headers.get('Authorization')
         if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'Admin authorization required'}), 401
+            return None
+        token = auth_header.split(' ')[1]
+        payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
+        revoked_sessions.ensure_started()
+        if payload.get('sid') and revoked_sessions.is_revoked(payload['sid']):
+            raise RevokedTokenError('Token has been revoked')
+        g.token_payload = payload
+    return g.token_payload
+
 
+def admin_required(f):
+    @functools.wraps(f)
+    def decorated_function(*args, **kwargs):
         try:
-            token = auth_header.split(' ')[1]
-            payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-            admin_id = payload.get('admin_id')
-            admin = Admin.query.filter_by(id=admin_id).first()
-            print(admin, token, admin_id)
-            if not admin:
-                return jsonify({'error': 'Admin access denied'}), 403
-            # Attach admin to request for use in function if needed
-            request.admin = admin
+            payload = token_payload()
         except jwt.InvalidTokenError:
             return jsonify({'error': 'Invalid token'}), 401
+        if payload is None:
+            return jsonify({'error': 'Admin authorization required'}), 401
+
+        admin = principal_cache.get('admin', payload.get('admin_id'))
+        if not admin:
+            return jsonify({'error': 'Admin access denied'}), 403
+        # Attach admin to request for use in function if needed
+        g.principal = request.admin = admin
         return f(*args, **kwargs)
     return decorated_function
 
@@ -29,20 +135,16 @@ def admin_required(f):
 def user_required(f):
     @functools.wraps(f)
     def decorated_function(*args, **kwargs):
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({'error': 'User authorization required'}), 401
-
         try:
-            token = auth_header.split(' ')[1]
-            payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-            user_id = payload.get('user_id')
-            from models import User
-            user = User.query.filter_by(id=user_id).first()
-            if not user:
-                return jsonify({'error': 'User access denied'}), 403
-            request.user = user
+            payload = token_payload()
         except jwt.InvalidTokenError:
             return jsonify({'error': 'Invalid token'}), 401
+        if payload is None:
+            return jsonify({'error': 'User authorization required'}), 401
+
+        user = principal_cache.get('user', payload.get('user_id'))
+        if not user:
+            return jsonify({'error': 'User access denied'}), 403
+        g.principal = request.user = user
         return f(*args, **kwargs)
-    return decorated_function
\ No newline at end of file
+    return decorated_function
@@ -0,0 +1,44 @@
+import logging
+import queue
+import threading
+from flask import current_app
+
+
+class DeferredJobs:
+    """Runs named jobs on one background thread, after the request that asked for them has returned.
+
+    Submitting a job that is already waiting is a no-op, so a burst of requests
+    triggers a single run. Jobs must be idempotent: they are best-effort, and a
+    job lost when the worker stops is picked up by the next run.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._thread = None
+
+    def submit(self, name, job):
+        """Queue `job()` to run later inside an app context, unless `name` is already queued"""
+        with self._lock:
+            if name in self._pending:
+                return
+            self._pending.add(name)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        self._queue.put((name, job, current_app._get_current_object()))
+
+    def _run(self):
+        while True:
+            name, job, app = self._queue.get()
+            with self._lock:
+                self._pending.discard(name)
+            try:
+                with app.app_context():
+                    job()
+            except Exception as e:
+                logging.error(f"Deferred job '{name}' failed: {str(e)}")
+
+
+deferred_jobs = DeferredJobs()
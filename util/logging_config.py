@@ -0,0 +1,171 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import threading
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from flask import g, has_request_context, request
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        if getattr(record, 'method', None):
+            entry['method'] = record.method
+            entry['path'] = record.path
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SizedTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """Rotates at `when` like TimedRotatingFileHandler, and also whenever the file would exceed `maxBytes`"""
+
+    def __init__(self, filename, maxBytes=0, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.maxBytes = maxBytes
+
+    def shouldRollover(self, record):
+        if super().shouldRollover(record):
+            return True
+        if self.maxBytes and self.stream is not None:
+            return self.stream.tell() + len(self.format(record)) + 1 >= self.maxBytes
+        return False
+
+    def _backups(self):
+        """(index, path) of every backup; the index only grows, so it orders them by age"""
+        dir_name, base_name = os.path.split(self.baseFilename)
+        prefix = base_name + '.'
+        backups = []
+        for file_name in os.listdir(dir_name):
+            if not file_name.startswith(prefix):
+                continue
+            period, _, index = file_name[len(prefix):].partition('.')
+            if not self.extMatch.match(period):
+                continue
+            # Backups named before the index was added count as the oldest
+            backups.append((int(index) if index.isdigit() else 0, os.path.join(dir_name, file_name)))
+        return sorted(backups)
+
+    def rotation_filename(self, default_name):
+        # Every rollover, by size or time: logFile.log.<period>.<n>, n one more than any existing backup
+        backups = self._backups()
+        return f'{default_name}.{backups[-1][0] + 1 if backups else 1}'
+
+    def getFilesToDelete(self):
+        backups = self._backups()
+        if len(backups) <= self.backupCount:
+            return []
+        return [path for _, path in backups[:len(backups) - self.backupCount]]
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records with the request id while still on the request thread"""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.method = request.method
+            record.path = request.path
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Keeps 1 DEBUG record in `every` per call site; other levels always pass"""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = max(1, every)
+        self._lock = threading.Lock()
+        self._seen = {}
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.every == 1:
+            return True
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._seen.get(key, 0)
+            self._seen[key] = count + 1
+        return count % self.every == 0
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the writer thread; drops them when the queue is full instead of waiting"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Resolve the message and traceback here, the writer thread only serializes
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener = None
+
+
+def configure_logging(app):
+    """Route every log record through a queue to one background writer; call once at app start"""
+    global _listener
+    if _listener is not None:
+        return
+    config = app.config
+
+    os.makedirs(config['LOG_DIR'], exist_ok=True)
+    file_handler = SizedTimedRotatingFileHandler(
+        os.path.join(config['LOG_DIR'], config['LOG_FILE']),
+        maxBytes=config['LOG_MAX_BYTES'],
+        when=config['LOG_ROTATE_WHEN'],
+        backupCount=config['LOG_BACKUP_COUNT'],
+        encoding='utf-8',
+        utc=True
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=config['LOG_QUEUE_SIZE']))
+    queue_handler.addFilter(DebugSamplingFilter(config['LOG_DEBUG_SAMPLE_EVERY']))
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(config['LOG_LEVEL'])
+
+    _listener = QueueListener(queue_handler.queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+
+    @app.after_request
+    def expose_request_id(response):
+        if g.get('request_id'):
+            response.headers['X-Request-ID'] = g.request_id
+        return response
@@ -0,0 +1,78 @@
+import base64
+import json
+from datetime import datetime
+from urllib.parse import urlencode
+from flask import request
+from sqlalchemy import and_, or_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+
+class PaginationError(ValueError):
+    """Bad ?limit or ?cursor value, reported to the client as a 400"""
+
+
+def encode_cursor(date, id_):
+    payload = json.dumps([date.isoformat() if date else None, id_])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date, id_ = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return (datetime.fromisoformat(date) if date else None), id_
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor')
+
+
+def keyset_paginate(query, date_column, id_column):
+    """Newest-first page of `query` driven by ?limit and ?cursor, returns (items, next_cursor).
+
+    Items must expose `date_column` and `id_column` under their column keys
+    (ORM entities, or rows selecting those columns unlabeled). Tables without
+    a date pass `date_column=None` and are paged on the id alone.
+    """
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    if limit < 1:
+        raise PaginationError('limit must be a positive integer')
+    limit = min(limit, MAX_LIMIT)
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        date, id_ = decode_cursor(cursor)
+        if date_column is None:
+            query = query.filter(id_column < id_)
+        elif date is None:
+            # NULL dates sort after every dated row in a DESC scan (MySQL/SQLite)
+            query = query.filter(and_(date_column.is_(None), id_column < id_))
+        else:
+            query = query.filter(or_(
+                date_column < date,
+                and_(date_column == date, id_column < id_),
+                date_column.is_(None)
+            ))
+
+    if date_column is None:
+        query = query.order_by(id_column.desc())
+    else:
+        query = query.order_by(date_column.desc(), id_column.desc())
+    items = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        date = getattr(last, date_column.key) if date_column is not None else None
+        next_cursor = encode_cursor(date, getattr(last, id_column.key))
+    return items, next_cursor
+
+
+def next_page_headers(next_cursor):
+    """`Link: <...>; rel="next"` header for endpoints whose body is a bare JSON array"""
+    if not next_cursor:
+        return {}
+    args = request.args.to_dict()
+    args['cursor'] = next_cursor
+    return {'Link': f'<{request.base_url}?{urlencode(args)}>; rel="next"'}
@@ -0,0 +1,104 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+from flask import jsonify
+
+
+class PasswordPoolBusy(Exception):
+    """Every bcrypt worker is busy and the wait queue is full; answered with a 503"""
+
+
+def busy_response():
+    return jsonify({'error': 'Server busy, please retry shortly'}), 503, {'Retry-After': '1'}
+
+
+# Run inside the pool processes: module-level and free of Flask state so they pickle
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _verify(password, hashed, rounds):
+    """(matches, new hash when the stored one uses another work factor)"""
+    if not bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8')):
+        return False, None
+    if int(hashed.split('$')[2]) != rounds:
+        return True, _hash(password, rounds)
+    return True, None
+
+
+class PasswordPool:
+    """bcrypt off the request threads, on at most `size` processes.
+
+    At most `queue_limit` calls may be running or waiting at once; the next one
+    fails fast with PasswordPoolBusy instead of piling up behind a login storm.
+    A caller that waits longer than `timeout` gets PasswordPoolBusy too.
+    init_app() takes all four settings from the app config (BCRYPT_*), so the
+    work factor always matches the one Flask-Bcrypt uses.
+    """
+
+    def __init__(self, size=1, queue_limit=8, timeout=10, rounds=12):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._configure(size, queue_limit, timeout, rounds)
+
+    def init_app(self, app):
+        config = app.config
+        self._configure(config['BCRYPT_POOL_SIZE'], config['BCRYPT_QUEUE_LIMIT'],
+                        config['BCRYPT_TIMEOUT'], config['BCRYPT_LOG_ROUNDS'])
+
+    def _configure(self, size, queue_limit, timeout, rounds):
+        with self._lock:
+            self.size = size
+            self.timeout = timeout
+            self.rounds = rounds
+            self._slots = threading.BoundedSemaphore(queue_limit)
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _submit(self, fn, *args):
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise PasswordPoolBusy()
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.size)
+            executor = self._executor
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException as e:
+            slots.release()
+            if isinstance(e, BrokenProcessPool):
+                self._discard(executor)
+            raise
+        # The slot is held until a worker is done with the call, not until this caller stops waiting
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Drop it if no worker picked it up yet; a running one keeps its slot until it ends
+            future.cancel()
+            raise PasswordPoolBusy()
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+
+    def _discard(self, executor):
+        """A worker died: start a fresh pool for the next caller"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def hash(self, password):
+        return self._submit(_hash, password, self.rounds)
+
+    def verify(self, password, hashed):
+        """(matches, rehash) where rehash is the new hash to store when the work factor changed, else None"""
+        if not password or not hashed:
+            return False, None
+        return self._submit(_verify, password, hashed, self.rounds)
+
+
+password_pool = PasswordPool()
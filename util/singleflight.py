@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+from flask import current_app
+
+
+class _Flight:
+    """One in-progress computation that concurrent callers wait on"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlightCache:
+    """Per-worker cache for expensive aggregates.
+
+    Identical concurrent requests share a single computation. A result is served
+    as-is for `ttl` seconds, then for `stale_ttl` more seconds while one
+    background thread recomputes it. After that the next caller recomputes inline.
+    Both durations are read from the app config by init_app().
+    """
+
+    def __init__(self, ttl_setting, stale_ttl_setting):
+        self.ttl_setting = ttl_setting
+        self.stale_ttl_setting = stale_ttl_setting
+        self.ttl = 0
+        self.stale_ttl = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._flights = {}
+        self._refreshing = set()
+        self._counters = {'hit': 0, 'stale': 0, 'miss': 0, 'coalesced': 0, 'refresh': 0, 'error': 0}
+
+    def init_app(self, app):
+        with self._lock:
+            self.ttl = app.config[self.ttl_setting]
+            self.stale_ttl = app.config[self.stale_ttl_setting]
+            self._entries.clear()
+
+    def get(self, key, compute):
+        """Return the cached value for `key`, computing it with `compute()` when needed"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                value, stored_at = entry
+                age = time.monotonic() - stored_at
+                if age < self.ttl:
+                    self._counters['hit'] += 1
+                    return value
+                if age < self.ttl + self.stale_ttl:
+                    self._counters['stale'] += 1
+                    if key not in self._refreshing and key not in self._flights:
+                        self._refreshing.add(key)
+                        threading.Thread(
+                            target=self._refresh,
+                            args=(key, compute, current_app._get_current_object()),
+                            daemon=True
+                        ).start()
+                    return value
+
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self._counters['miss'] += 1
+            else:
+                self._counters['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+            with self._lock:
+                self._entries[key] = (flight.value, time.monotonic())
+        except Exception as e:
+            flight.error = e
+            with self._lock:
+                self._counters['error'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+        return flight.value
+
+    def _refresh(self, key, compute, app):
+        try:
+            with app.app_context():
+                value = compute()
+            with self._lock:
+                self._entries[key] = (value, time.monotonic())
+                self._counters['refresh'] += 1
+        except Exception as e:
+            with self._lock:
+                self._counters['error'] += 1
+            logging.error(f"Background refresh of '{key}' failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries), in_flight=len(self._flights))
+
+
+# Shared by the admin dashboard and product ranking aggregates
+aggregate_cache = SingleFlightCache('AGGREGATE_CACHE_TTL', 'AGGREGATE_CACHE_STALE_TTL')
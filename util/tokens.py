@@ -0,0 +1,199 @@
+import hashlib
+import logging
+import secrets
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+import jwt
+from flask import current_app, g
+from sqlalchemy import select, update
+from extension import db
+from models import RefreshToken
+
+
+class RefreshTokenError(Exception):
+    """Unknown, expired, reused or revoked refresh token; answered with a 401"""
+
+
+class RevokedSessions:
+    """Login sessions ('sid') revoked recently enough for one of their access tokens to still be valid.
+
+    Each worker keeps the ids in memory and reloads them every REVOCATION_REFRESH_SECONDS
+    from a background thread, so checking a token never touches the DB. Only revocations
+    younger than ACCESS_TOKEN_TTL matter, which keeps the set small enough to hold exactly.
+    Both durations are read from the app config by init_app().
+    """
+
+    def __init__(self, refresh_setting, horizon_setting):
+        self.refresh_setting = refresh_setting
+        self.horizon_setting = horizon_setting
+        self.refresh_seconds = 30
+        self.horizon_seconds = 0
+        self._lock = threading.Lock()
+        self._sids = frozenset()
+        self._local = {}
+        self._thread = None
+
+    def init_app(self, app):
+        with self._lock:
+            self.refresh_seconds = app.config[self.refresh_setting]
+            self.horizon_seconds = app.config[self.horizon_setting]
+
+    def is_revoked(self, sid):
+        return sid in self._sids or sid in self._local
+
+    def add(self, sid):
+        """Revoked in this worker right away; the others learn it on their next reload"""
+        with self._lock:
+            self._local[sid] = time.monotonic()
+
+    def ensure_started(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, args=(current_app._get_current_object(),), daemon=True
+            )
+            self._thread.start()
+
+    def reload(self):
+        cutoff = datetime.utcnow() - timedelta(seconds=self.horizon_seconds)
+        sids = db.session.execute(
+            select(RefreshToken.family_id).where(RefreshToken.revoked_at >= cutoff).distinct()
+        ).scalars().all()
+        with self._lock:
+            self._sids = frozenset(sids)
+            # Local entries are now covered by the DB copy, or will be before they could matter
+            now = time.monotonic()
+            self._local = {sid: at for sid, at in self._local.items() if now - at < self.refresh_seconds * 2}
+
+    def _run(self, app):
+        while True:
+            try:
+                with app.app_context():
+                    self.reload()
+            except Exception as e:
+                logging.error(f"Revoked sessions reload failed: {str(e)}")
+            time.sleep(self.refresh_seconds)
+
+
+# The horizon is the access-token lifetime: older revocations concern only expired tokens
+revoked_sessions = RevokedSessions('REVOCATION_REFRESH_SECONDS', 'ACCESS_TOKEN_TTL')
+
+
+def _hash_token(raw):
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _access_token(kind, subject_id, email, sid):
+    payload = {
+        f'{kind}_id': subject_id,
+        'email': email,
+        'sid': sid,
+        'exp': datetime.now(timezone.utc) + timedelta(seconds=current_app.config['ACCESS_TOKEN_TTL'])
+    }
+    if kind == 'admin':
+        payload['is_admin'] = True
+    return jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
+
+
+def _new_refresh_token(kind, subject_id, family_id):
+    raw = secrets.token_urlsafe(48)
+    record = RefreshToken(
+        token_hash=_hash_token(raw),
+        family_id=family_id,
+        subject_kind=kind,
+        subject_id=subject_id,
+        expires_at=datetime.utcnow() + timedelta(seconds=current_app.config['REFRESH_TOKEN_TTL'])
+    )
+    db.session.add(record)
+    db.session.flush()
+    return raw, record
+
+
+def issue_tokens(kind, subject_id, email):
+    """Start a login session: access token + refresh token (the caller commits)"""
+    family_id = uuid.uuid4().hex
+    raw, _ = _new_refresh_token(kind, subject_id, family_id)
+    return {
+        'token': _access_token(kind, subject_id, email, family_id),
+        'refresh_token': raw,
+        'expires_in': current_app.config['ACCESS_TOKEN_TTL']
+    }
+
+
+def rotate_refresh_token(raw, email_of):
+    """Swap a refresh token for a new pair (the caller commits).
+
+    `email_of(kind, subject_id)` returns the subject's email, or None if it no longer exists.
+    Presenting an already rotated token revokes its whole session, as it means it leaked.
+    """
+    record = RefreshToken.query.filter_by(token_hash=_hash_token(raw or '')).first()
+    if not record or record.revoked_at:
+        raise RefreshTokenError('Invalid refresh token')
+    if record.replaced_by:
+        revoke_family(record.family_id)
+        db.session.commit()
+        raise RefreshTokenError('Refresh token reuse detected, session revoked')
+    if record.expires_at < datetime.utcnow():
+        raise RefreshTokenError('Refresh token has expired')
+
+    email = email_of(record.subject_kind, record.subject_id)
+    if email is None:
+        raise RefreshTokenError('Invalid refresh token')
+
+    new_raw, new_record = _new_refresh_token(record.subject_kind, record.subject_id, record.family_id)
+    # Conditional so two concurrent refreshes with the same token cannot both succeed
+    result = db.session.execute(
+        update(RefreshToken.__table__)
+        .where(RefreshToken.__table__.c.id == record.id, RefreshToken.__table__.c.replaced_by.is_(None))
+        .values(replaced_by=new_record.id)
+    )
+    if result.rowcount != 1:
+        db.session.rollback()
+        raise RefreshTokenError('Invalid refresh token')
+    return {
+        'token': _access_token(record.subject_kind, record.subject_id, email, record.family_id),
+        'refresh_token': new_raw,
+        'expires_in': current_app.config['ACCESS_TOKEN_TTL']
+    }
+
+
+def revoke_family(family_id):
+    """Revoke a login session: its refresh tokens stop working, its access tokens within one reload"""
+    table = RefreshToken.__table__
+    db.session.execute(
+        update(table).where(table.c.family_id == family_id, table.c.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+    revoked_sessions.add(family_id)
+
+
+def revoke_refresh_token(raw):
+    """Logout: revoke the session the refresh token belongs to; returns False if unknown"""
+    record = RefreshToken.query.filter_by(token_hash=_hash_token(raw or '')).first()
+    if not record:
+        return False
+    revoke_family(record.family_id)
+    return True
+
+
+def current_family(kind, subject_id):
+    """The caller's own login session when their access token belongs to (kind, subject_id), else None"""
+    payload = g.get('token_payload') or {}
+    if payload.get(f'{kind}_id') != subject_id:
+        return None
+    return payload.get('sid')
+
+
+def revoke_subject(kind, subject_id, keep_family=None):
+    """Revoke every session of a user/admin, e.g. after a password change, except `keep_family` if given"""
+    table = RefreshToken.__table__
+    live = [table.c.subject_kind == kind, table.c.subject_id == subject_id, table.c.revoked_at.is_(None)]
+    if keep_family:
+        live.append(table.c.family_id != keep_family)
+    family_ids = db.session.execute(select(table.c.family_id).where(*live).distinct()).scalars().all()
+    db.session.execute(update(table).where(*live).values(revoked_at=datetime.utcnow()))
+    for family_id in family_ids:
+        revoked_sessions.add(family_id)
@@ -1,9 +1,83 @@
+import hashlib
+import os
 import secrets
-import re
+import socket
+import threading
+import time
+
+# Ids are 12 chars: 6 for the time in seconds, 3 for the process, 3 for a per-second sequence.
+# Every char is 0-9A-Z: the id columns use MySQL's case-insensitive default collation, where
+# 'a' and 'A' are the same key. New rows land at the right edge of the primary-key B-tree.
+ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+EPOCH = 1704067200  # 2024-01-01 UTC, the 6-char prefix lasts until 2093
+NODE_SPACE = len(ALPHABET) ** 3
+SEQUENCE_SPACE = len(ALPHABET) ** 3
+
+
+def _encode(value, width):
+    base = len(ALPHABET)
+    chars = []
+    for _ in range(width):
+        value, digit = divmod(value, base)
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def _node_id():
+    """3 chars derived from this host and process, so concurrent workers get different nodes"""
+    digest = hashlib.sha256(f'{socket.gethostname()}:{os.getpid()}'.encode('utf-8')).digest()
+    return _encode(int.from_bytes(digest[:8], 'big') % NODE_SPACE, 3)
+
+
+class _IdAllocator:
+    """Hands out ids for this process: a node id from host and pid, and a sequence that restarts
+    at a random offset every second so two processes whose node ids clash rarely overlap"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._node = _node_id()
+        self._second = None
+        self._start = 0
+        self._used = 0
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def allocate(self, count):
+        ids = []
+        with self._lock:
+            while len(ids) < count:
+                second = int(time.time()) - EPOCH
+                if second != self._second:
+                    self._second = second
+                    self._start = secrets.randbelow(SEQUENCE_SPACE)
+                    self._used = 0
+                elif self._used >= SEQUENCE_SPACE:
+                    # Sequence exhausted for this second: wait for the next one
+                    time.sleep(0.001)
+                    continue
+
+                prefix = _encode(second, 6) + self._node
+                take = min(count - len(ids), SEQUENCE_SPACE - self._used)
+                for offset in range(self._used, self._used + take):
+                    ids.append(prefix + _encode((self._start + offset) % SEQUENCE_SPACE, 3))
+                self._used += take
+        return ids
+
+
+_allocator = _IdAllocator()
+# A forked worker has a new pid: give it its own node and sequence
+os.register_at_fork(after_in_child=_allocator._after_fork)
+
 
 def generate_id():
-    while True:
-        candidate = secrets.token_urlsafe(16)[:12]
-        # Assure 12 chars alphanumériques
-        if re.match(r'^[a-zA-Z0-9]{12}$', candidate):
-            return candidate
\ No newline at end of file
+    return _allocator.allocate(1)[0]
+
+
+def generate_ids(count):
+    """`count` ids at once for bulk inserts, allocated under a single lock"""
+    return _allocator.allocate(count)